@@ -0,0 +1,66 @@
+import asyncio
+import logging
+from datetime import datetime
+from sqlalchemy import case, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models.user import Community, CommunityMembership, Post
+from config.config import settings
+from database.db import AsyncSessionLocal
+from utils.http_cache import invalidate_responses
+
+
+# communities.member_count, post_count and last_activity_at are maintained
+# on write: every path that adds or removes a member or a post calls
+# record_activity() before committing, so the counters commit or roll back
+# with the change itself. verify_community_stats() periodically recounts
+# them to repair drift from writes outside those paths, e.g. rows removed by
+# ON DELETE CASCADE.
+
+logger = logging.getLogger(__name__)
+
+
+async def record_activity(db: AsyncSession, community_id: int, members: int = 0, posts: int = 0, at: datetime = None):
+    values = {}
+    if members:
+        values["member_count"] = Community.member_count + members
+    if posts:
+        values["post_count"] = Community.post_count + posts
+    if at is not None:
+        values["last_activity_at"] = case((Community.last_activity_at < at, at), else_=Community.last_activity_at)
+    await db.execute(
+        update(Community).where(Community.id == community_id).values(**values).execution_options(synchronize_session=False)
+    )
+
+
+async def verify_community_stats() -> int:
+    members = select(func.count()).where(CommunityMembership.community_id == Community.id).scalar_subquery()
+    posts = select(func.count()).where(Post.community_id == Community.id).scalar_subquery()
+    latest_post = select(func.max(Post.created_at)).where(Post.community_id == Community.id).scalar_subquery()
+
+    async with AsyncSessionLocal() as db:
+        repaired = (await db.scalars(
+            update(Community)
+            .where(or_(Community.member_count != members, Community.post_count != posts, Community.last_activity_at < latest_post))
+            .values(
+                member_count=members,
+                post_count=posts,
+                last_activity_at=case((Community.last_activity_at < latest_post, latest_post), else_=Community.last_activity_at),
+            )
+            .returning(Community.id)
+            .execution_options(synchronize_session=False)
+        )).all()
+        await db.commit()
+
+    if repaired:
+        logger.warning("Repaired stats of %d communities", len(repaired))
+        await invalidate_responses(*[f"community:{community_id}" for community_id in repaired])
+    return len(repaired)
+
+
+async def run_community_stats_verifier():
+    while True:
+        await asyncio.sleep(settings.COMMUNITY_STATS_VERIFY_INTERVAL_SECONDS)
+        try:
+            await verify_community_stats()
+        except Exception:
+            logger.exception("Failed to verify community stats")
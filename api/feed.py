@@ -0,0 +1,109 @@
+from sqlalchemy import delete, exists, insert, literal, select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.loaders import POST_PAGE_KEY
+from api.models.user import Community, CommunityMembership, Post, TimelineEntry
+from config.config import settings
+from utils.cache import TTLCache
+from utils.pagination import encode_cursor, keyset_paginate
+
+
+# Posts are fanned out on write into each member's timeline while their
+# community has at most FEED_FANOUT_THRESHOLD members. Larger communities are
+# merged in on read instead, so one post never costs tens of thousands of
+# inserts. Reads pull from communities above half the threshold, which covers
+# posts that skipped fan-out unless the community shrinks by half since; both
+# sources overlapping in between is harmless as pages are deduplicated.
+FEED_PAGE_KEY = (TimelineEntry.created_at, TimelineEntry.post_id)
+
+community_sizes = TTLCache("community_sizes", settings.MEMBERSHIP_CACHE_MAX_SIZE, settings.COMMUNITY_SIZE_CACHE_TTL_SECONDS)
+
+
+async def get_community_sizes(db: AsyncSession, community_ids) -> dict:
+    sizes, missing = {}, []
+    for community_id in community_ids:
+        size = community_sizes.get(community_id)
+        if size is None:
+            missing.append(community_id)
+        else:
+            sizes[community_id] = size
+
+    if missing:
+        counted = dict((await db.execute(
+            select(Community.id, Community.member_count).where(Community.id.in_(missing))
+        )).all())
+        for community_id in missing:
+            sizes[community_id] = counted.get(community_id, 0)
+            community_sizes.set(community_id, sizes[community_id])
+    return sizes
+
+
+def adjust_community_size(community_id: int, delta: int):
+    size = community_sizes.get(community_id)
+    if size is not None:
+        community_sizes.set(community_id, max(0, size + delta))
+
+
+async def fan_out_post(db: AsyncSession, post: Post):
+    # Runs after the post is flushed so the timeline rows commit with it.
+    readers = select(literal(post.owner_id).label("user_id"))
+    if post.community_id is not None:
+        size = (await get_community_sizes(db, [post.community_id]))[post.community_id]
+        if size <= settings.FEED_FANOUT_THRESHOLD:
+            readers = union(
+                readers,
+                select(CommunityMembership.user_id).where(CommunityMembership.community_id == post.community_id),
+            )
+    readers = readers.subquery()
+
+    await db.execute(
+        insert(TimelineEntry).from_select(
+            ["user_id", "post_id", "community_id", "created_at"],
+            select(readers.c.user_id, Post.id, Post.community_id, Post.created_at)
+            .select_from(readers.join(Post, Post.id == post.id)),
+        )
+    )
+
+
+async def backfill_timeline(db: AsyncSession, user_id: int, community_id: int):
+    size = (await get_community_sizes(db, [community_id]))[community_id]
+    if size > settings.FEED_FANOUT_THRESHOLD:
+        return
+
+    recent = (
+        select(literal(user_id), Post.id, Post.community_id, Post.created_at)
+        .where(
+            Post.community_id == community_id,
+            ~exists().where(TimelineEntry.user_id == user_id, TimelineEntry.post_id == Post.id),
+        )
+        .order_by(Post.created_at.desc(), Post.id.desc())
+        .limit(settings.FEED_BACKFILL_POSTS)
+    )
+    await db.execute(insert(TimelineEntry).from_select(["user_id", "post_id", "community_id", "created_at"], recent))
+
+
+async def drop_from_timeline(db: AsyncSession, user_id: int, community_id: int):
+    # The user's own posts stay in their feed after leaving.
+    await db.execute(
+        delete(TimelineEntry).where(
+            TimelineEntry.user_id == user_id,
+            TimelineEntry.community_id == community_id,
+            TimelineEntry.post_id.in_(select(Post.id).where(Post.community_id == community_id, Post.owner_id != user_id)),
+        )
+    )
+
+
+async def feed_page(db: AsyncSession, user_id: int, memberships, limit: int, cursor=None):
+    rows = (await db.execute(
+        keyset_paginate(select(*FEED_PAGE_KEY).where(TimelineEntry.user_id == user_id), FEED_PAGE_KEY, cursor, limit=limit)
+    )).all()
+
+    sizes = await get_community_sizes(db, memberships)
+    pulled = [community_id for community_id, size in sizes.items() if size > settings.FEED_FANOUT_THRESHOLD // 2]
+    if pulled:
+        rows += (await db.execute(
+            keyset_paginate(select(*POST_PAGE_KEY).where(Post.community_id.in_(pulled)), POST_PAGE_KEY, cursor, limit=limit)
+        )).all()
+
+    page = sorted({tuple(row) for row in rows}, reverse=True)[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(page) == limit else None
+    return [post_id for _, post_id in page], next_cursor
@@ -0,0 +1,160 @@
+from typing import Optional
+from fastapi import HTTPException, Response, status
+from pydantic_core import to_json
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, load_only, raiseload, selectinload
+from api.loaders import comment_response_options, latest_community_posts
+from api.models.user import Comment, Community, CommunityMembership, Event, Post, User
+from api.schemas.user import CommentResponse, PostPreview, Profile
+from utils.images import image_variants
+from utils.serialization import SHAPE_NESTED, construct
+
+
+# Sparse fieldsets for ?fields= and ?expand=. Each FieldSet lists what a
+# resource can return: plain columns, computed fields with the columns they
+# need, correlated counts, and relationships. The query for a request loads
+# only the selected columns, adds only the selected counts and attaches loader
+# options only for expanded relationships; everything else is raiseload, so an
+# unrequested relationship can never be queried.
+
+
+class Relation:
+    def __init__(self, schema, option=None, fetch=None, many=False):
+        self.schema = schema
+        self.option = option
+        self.fetch = fetch
+        self.many = many
+
+
+class Selection:
+    def __init__(self, fields: set, expand: set):
+        self.fields = fields
+        self.expand = expand
+
+
+def split_names(value: Optional[str]) -> set:
+    return {name.strip() for name in (value or "").split(",") if name.strip()}
+
+
+class FieldSet:
+    def __init__(self, model, columns, computed=None, counts=None, relations=None, keys=("id",)):
+        # keys are always loaded, whether selected or not, so the next page
+        # cursor can be read from the rows.
+        self.model = model
+        self.keys = keys
+        self.columns = columns
+        self.computed = computed or {}
+        self.counts = counts or {}
+        self.relations = relations or {}
+
+    def parse(self, fields: Optional[str], expand: Optional[str], shape: str = SHAPE_NESTED) -> Optional[Selection]:
+        # None means neither parameter was given and the route's full
+        # response applies.
+        if fields is None and expand is None:
+            return None
+        if shape != SHAPE_NESTED:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="fields and expand can't be combined with shape")
+
+        names = split_names(fields) if fields is not None else set(self.columns) | set(self.computed)
+        expanded = split_names(expand)
+        unknown = (names - set(self.columns) - set(self.computed) - set(self.counts) - set(self.relations)) | (expanded - set(self.relations))
+        if unknown:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+        return Selection(names - set(self.relations), expanded | (names & set(self.relations)))
+
+    def query(self, selection: Selection):
+        columns = set(self.keys) | {name for name in self.columns if name in selection.fields}
+        for name, (dependencies, _) in self.computed.items():
+            if name in selection.fields:
+                columns.update(dependencies)
+
+        options = [load_only(*[getattr(self.model, name) for name in columns])]
+        options += [relation.option() for name, relation in self.relations.items() if name in selection.expand and relation.option]
+        options.append(raiseload("*"))
+
+        counts = [count().label(name) for name, count in self.counts.items() if name in selection.fields]
+        return select(self.model).options(*options).add_columns(*counts)
+
+    async def render(self, db: AsyncSession, rows, selection: Selection, many: bool = True, response: Response = None) -> Response:
+        objects = [row[0] for row in rows]
+        fetched = {
+            name: await relation.fetch(db, [obj.id for obj in objects])
+            for name, relation in self.relations.items()
+            if name in selection.expand and relation.fetch
+        }
+
+        built, items = {}, []
+        for row in rows:
+            obj, item = row[0], {}
+            for name in self.columns:
+                if name in selection.fields:
+                    item[name] = getattr(obj, name)
+            for name, (_, compute) in self.computed.items():
+                if name in selection.fields:
+                    item[name] = compute(obj)
+            for name in self.counts:
+                if name in selection.fields:
+                    item[name] = row._mapping[name]
+            for name, relation in self.relations.items():
+                if name in selection.expand:
+                    value = fetched[name][obj.id] if relation.fetch else getattr(obj, name)
+                    if relation.many:
+                        value = [construct(relation.schema, related, built) for related in value]
+                    elif value is not None:
+                        value = construct(relation.schema, value, built)
+                    item[name] = value
+            items.append(item)
+
+        headers = dict(response.headers) if response is not None else None
+        if headers:
+            headers.pop("content-length", None)
+        return Response(content=to_json(items if many else items[0]), headers=headers, media_type="application/json")
+
+
+def count_where(model, *criteria):
+    return lambda: select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+
+post_fields = FieldSet(
+    Post,
+    columns=("id", "content", "post_image", "created_at", "owner_id", "community_id", "like_count"),
+    computed={"post_image_variants": (("post_image",), lambda post: image_variants(post.post_image))},
+    counts={"comment_count": count_where(Comment, Comment.post_id == Post.id)},
+    relations={
+        "owner": Relation(Profile, option=lambda: joinedload(Post.owner)),
+        "comments": Relation(CommentResponse, option=lambda: selectinload(Post.comments).options(*comment_response_options()), many=True),
+    },
+    keys=("created_at", "id"),
+)
+
+community_fields = FieldSet(
+    Community,
+    columns=("id", "name", "description", "owner_id", "member_count", "post_count", "last_activity_at"),
+    relations={
+        "owner": Relation(Profile, option=lambda: joinedload(Community.owner)),
+        "latest_posts": Relation(PostPreview, fetch=latest_community_posts, many=True),
+    },
+)
+
+event_fields = FieldSet(
+    Event,
+    columns=("id", "title", "description", "event_date", "location", "image"),
+    computed={"image_variants": (("image",), lambda event: image_variants(event.image))},
+    counts={"comment_count": count_where(Comment, Comment.event_id == Event.id)},
+    relations={
+        "comments": Relation(CommentResponse, option=lambda: selectinload(Event.comments).options(*comment_response_options()), many=True),
+    },
+    keys=("event_date", "id"),
+)
+
+user_fields = FieldSet(
+    User,
+    columns=("id", "name", "email", "bio", "profile_image", "username", "role"),
+    computed={"profile_image_variants": (("profile_image",), lambda user: image_variants(user.profile_image))},
+    counts={
+        "post_count": count_where(Post, Post.owner_id == User.id),
+        "community_count": count_where(CommunityMembership, CommunityMembership.user_id == User.id),
+    },
+)
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import threading
+from collections import Counter
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from api.memberships import INSERT_DIALECTS
+from api.models.user import Like, Post
+from config.config import settings
+from database.db import AsyncSessionLocal
+from utils.http_cache import invalidate_responses
+
+
+# posts.like_count is denormalized from the likes table. Like and unlike only
+# write their own `likes` row; the +1/-1 lands in an in-process buffer that is
+# flushed every LIKE_FLUSH_INTERVAL_SECONDS as one batched UPDATE, so a burst
+# of likes on one post becomes a single row update per flush instead of
+# thousands of writers queueing on that row's lock. Counts can drift (a
+# process dying with a full buffer, a failed flush), so reconcile_like_counts
+# periodically recounts from `likes` and repairs them.
+#
+# A recount can't simply overwrite like_count: other workers may still buffer
+# deltas for likes the `likes` table already shows, and those would be counted
+# twice once flushed. A lock shared with the flush doesn't help, since those
+# deltas sit in another process's memory. So only posts with no recent like
+# activity are repaired: drift is sampled twice, more than a flush interval
+# apart, and a post whose count and recount both held still in between has no
+# delta left in any buffer. It's repaired by the drift it showed, not set to
+# the recount, so a like landing after the second sample keeps its own delta.
+# A worker that fails to flush for longer than the settle window can still be
+# double-counted; the next reconcile corrects that.
+
+logger = logging.getLogger(__name__)
+
+posts_table = Post.__table__
+apply_deltas = (
+    update(posts_table)
+    .where(posts_table.c.id == bindparam("post"))
+    .values(like_count=posts_table.c.like_count + bindparam("delta"))
+)
+recount = select(func.count()).where(Like.post_id == posts_table.c.id).scalar_subquery()
+select_drift = (
+    select(posts_table.c.id, posts_table.c.like_count, recount.label("counted"))
+    .where(posts_table.c.like_count != recount)
+)
+
+
+class LikeBuffer:
+    def __init__(self):
+        self.deltas = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, post_id: int, delta: int):
+        with self.lock:
+            self.deltas[post_id] += delta
+
+    def pending(self, post_id: int) -> int:
+        return self.deltas.get(post_id, 0)
+
+    def take(self) -> dict:
+        with self.lock:
+            deltas, self.deltas = self.deltas, Counter()
+        return {post_id: delta for post_id, delta in deltas.items() if delta}
+
+    def restore(self, deltas: dict):
+        with self.lock:
+            self.deltas.update(deltas)
+
+
+like_buffer = LikeBuffer()
+flush_lock = asyncio.Lock()
+
+
+async def like_post(db: AsyncSession, post_id: int, user_id: int) -> bool:
+    # Returns False when the post was already liked.
+    values = {"user_id": user_id, "post_id": post_id}
+    insert = INSERT_DIALECTS.get(db.bind.dialect.name)
+    if insert is not None:
+        result = await db.execute(insert(Like).values(**values).on_conflict_do_nothing())
+    else:
+        if await db.scalar(select(Like.post_id).where(Like.user_id == user_id, Like.post_id == post_id)):
+            return False
+        result = await db.execute(Like.__table__.insert().values(**values))
+    await db.commit()
+
+    liked = result.rowcount > 0
+    if liked:
+        like_buffer.add(post_id, 1)
+    return liked
+
+
+async def unlike_post(db: AsyncSession, post_id: int, user_id: int) -> bool:
+    result = await db.execute(delete(Like).where(Like.user_id == user_id, Like.post_id == post_id))
+    await db.commit()
+
+    unliked = result.rowcount > 0
+    if unliked:
+        like_buffer.add(post_id, -1)
+    return unliked
+
+
+async def flush_like_counts() -> int:
+    async with flush_lock:
+        deltas = like_buffer.take()
+        if not deltas:
+            return 0
+
+        # Sorted so concurrent flushes from several workers lock rows in the
+        # same order.
+        params = [{"post": post_id, "delta": deltas[post_id]} for post_id in sorted(deltas)]
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(apply_deltas, params)
+                await db.commit()
+        except Exception:
+            like_buffer.restore(deltas)
+            raise
+
+    await invalidate_responses("posts", *[f"post:{post_id}" for post_id in deltas])
+    return len(deltas)
+
+
+async def like_drift() -> dict:
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(select_drift)
+        return {row.id: (row.like_count, row.counted) for row in rows}
+
+
+async def reconcile_like_counts(settle_seconds: float = None) -> int:
+    # settle_seconds defaults to two flush intervals; pass 0 only when no
+    # other process is writing likes, e.g. right after seeding.
+    if settle_seconds is None:
+        settle_seconds = 2 * settings.LIKE_FLUSH_INTERVAL_SECONDS
+    await flush_like_counts()
+    before = await like_drift()
+    if not before:
+        return 0
+    await asyncio.sleep(settle_seconds)
+    after = await like_drift()
+
+    params = [
+        {"post": post_id, "delta": counted - like_count}
+        for post_id, (like_count, counted) in sorted(after.items())
+        if before.get(post_id) == (like_count, counted)
+    ]
+    if params:
+        async with AsyncSessionLocal() as db:
+            await db.execute(apply_deltas, params)
+            await db.commit()
+        logger.warning("Repaired like counts of %d posts", len(params))
+        await invalidate_responses("posts", *[f"post:{param['post']}" for param in params])
+    return len(params)
+
+
+async def run_like_jobs():
+    reconciled = 0.0
+    while True:
+        await asyncio.sleep(settings.LIKE_FLUSH_INTERVAL_SECONDS)
+        reconciled += settings.LIKE_FLUSH_INTERVAL_SECONDS
+        try:
+            if reconciled >= settings.LIKE_RECONCILE_INTERVAL_SECONDS:
+                reconciled = 0.0
+                await reconcile_like_counts()
+            else:
+                await flush_like_counts()
+        except Exception:
+            logger.exception("Failed to write like counts")
+
+
+async def annotate_likes(db: AsyncSession, posts, user_id: int = None) -> dict:
+    # Folds in deltas not flushed yet, without making the posts dirty in the
+    # session, and returns the viewer's fields for render(computed=...).
+    for post in posts:
+        pending = like_buffer.pending(post.id)
+        if pending:
+            set_committed_value(post, "like_count", post.like_count + pending)
+
+    liked = set()
+    if user_id is not None and posts:
+        liked = set(await db.scalars(select(Like.post_id).where(Like.user_id == user_id, Like.post_id.in_([post.id for post in posts]))))
+    return {"liked_by_me": lambda post: post.id in liked}
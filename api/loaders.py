@@ -0,0 +1,89 @@
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from api.models.user import Announcement, Comment, Community, Event, Post
+
+
+LATEST_POSTS_PREVIEW = 3
+
+# Sort keys used for keyset pagination of each listing. Each one is backed by
+# a matching index on the model.
+POST_PAGE_KEY = (Post.created_at, Post.id)
+ANNOUNCEMENT_PAGE_KEY = (Announcement.created_at, Announcement.id)
+EVENT_PAGE_KEY = (Event.event_date, Event.id)
+COMMUNITY_PAGE_KEY = (Community.id,)
+
+# Discovery orders for community listings, read from the denormalized stats
+# columns and paginated newest/largest first.
+COMMUNITY_SORT_KEYS = {
+    "largest": (Community.member_count, Community.id),
+    "active": (Community.last_activity_at, Community.id),
+}
+
+
+# Loader options matching the nesting of each response schema, so a route
+# returning that schema loads everything it serializes in a fixed number of
+# queries instead of lazy loading per row.
+
+def comment_response_options():
+    return (joinedload(Comment.user),)
+
+
+def post_response_options():
+    return (
+        joinedload(Post.owner),
+        selectinload(Post.comments).options(*comment_response_options()),
+    )
+
+
+def announcement_response_options():
+    return (joinedload(Announcement.owner),)
+
+
+async def latest_community_posts(db: AsyncSession, community_ids, per_community=LATEST_POSTS_PREVIEW):
+    if not community_ids:
+        return {}
+
+    ranked = (
+        select(
+            Post.id,
+            func.row_number().over(
+                partition_by=Post.community_id,
+                order_by=(Post.created_at.desc(), Post.id.desc()),
+            ).label("rank"),
+        )
+        .where(Post.community_id.in_(community_ids))
+        .subquery()
+    )
+    posts = await db.scalars(
+        select(Post)
+        .join(ranked, ranked.c.id == Post.id)
+        .where(ranked.c.rank <= per_community)
+        .order_by(Post.community_id, ranked.c.rank)
+    )
+
+    latest = {community_id: [] for community_id in community_ids}
+    for post in posts:
+        latest[post.community_id].append(post)
+    return latest
+
+
+async def community_summaries(db: AsyncSession, query):
+    communities = (await db.scalars(query.options(joinedload(Community.owner)))).all()
+    latest = await latest_community_posts(db, [community.id for community in communities])
+
+    return [community_summary(community, latest[community.id]) for community in communities]
+
+
+def community_summary(community: Community, latest_posts) -> dict:
+    return {
+        "id": community.id,
+        "name": community.name,
+        "description": community.description,
+        "owner_id": community.owner_id,
+        "owner": community.owner,
+        "member_count": community.member_count,
+        "post_count": community.post_count,
+        "last_activity_at": community.last_activity_at,
+        "latest_posts": latest_posts,
+    }
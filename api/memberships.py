@@ -0,0 +1,79 @@
+from datetime import datetime
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.community_stats import record_activity
+from api.feed import adjust_community_size, backfill_timeline, drop_from_timeline
+from api.models.user import CommunityMembership
+from config.config import settings
+from utils.cache import TTLCache
+
+
+# Community ids each user belongs to. Loaded with one scan of the
+# (user_id, community_id) primary key and patched in place by join/leave, so
+# membership checks on hot paths don't hit the database at all.
+user_memberships = TTLCache("user_memberships", settings.MEMBERSHIP_CACHE_MAX_SIZE, settings.MEMBERSHIP_CACHE_TTL_SECONDS)
+
+INSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+async def get_user_memberships(db: AsyncSession, user_id: int) -> frozenset:
+    memberships = user_memberships.get(user_id)
+    if memberships is None:
+        memberships = frozenset(
+            await db.scalars(select(CommunityMembership.community_id).where(CommunityMembership.user_id == user_id))
+        )
+        user_memberships.set(user_id, memberships)
+    return memberships
+
+
+async def is_member(db: AsyncSession, community_id: int, user_id: int) -> bool:
+    return community_id in await get_user_memberships(db, user_id)
+
+
+def update_cached_memberships(user_id: int, community_id: int, joined: bool):
+    memberships = user_memberships.get(user_id)
+    if memberships is not None:
+        memberships = memberships | {community_id} if joined else memberships - {community_id}
+        user_memberships.set(user_id, memberships)
+
+
+async def add_member(db: AsyncSession, community_id: int, user_id: int) -> bool:
+    # Returns False when the membership already existed. The conflict is
+    # resolved by the primary key, so concurrent joins can't race into an
+    # IntegrityError.
+    values = {"user_id": user_id, "community_id": community_id}
+    insert = INSERT_DIALECTS.get(db.bind.dialect.name)
+    if insert is not None:
+        result = await db.execute(insert(CommunityMembership).values(**values).on_conflict_do_nothing())
+    else:
+        if await is_member(db, community_id, user_id):
+            return False
+        result = await db.execute(CommunityMembership.__table__.insert().values(**values))
+
+    joined = result.rowcount > 0
+    if joined:
+        await record_activity(db, community_id, members=1, at=datetime.now())
+        await backfill_timeline(db, user_id, community_id)
+    await db.commit()
+
+    update_cached_memberships(user_id, community_id, joined=True)
+    if joined:
+        adjust_community_size(community_id, 1)
+    return joined
+
+
+async def remove_member(db: AsyncSession, community_id: int, user_id: int) -> bool:
+    result = await db.execute(
+        delete(CommunityMembership).where(CommunityMembership.user_id == user_id, CommunityMembership.community_id == community_id)
+    )
+    left = result.rowcount > 0
+    if left:
+        await record_activity(db, community_id, members=-1)
+        await drop_from_timeline(db, user_id, community_id)
+    await db.commit()
+
+    update_cached_memberships(user_id, community_id, joined=False)
+    if left:
+        adjust_community_size(community_id, -1)
+    return left
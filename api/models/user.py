@@ -1,6 +1,7 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, text, Text
+from sqlalchemy import DDL, Column, ForeignKey, Index, Integer, String, event, func, text, Text
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from database.db import Base
+from datetime import datetime
 from enum import Enum
 from sqlalchemy.orm import relationship, backref
 
@@ -10,6 +11,28 @@ class UserRole(Enum):
     ADMIN = 'admin'
 
 
+# Search indexes. Prefix lookups use a byte-ordered index on the lowered
+# column on both dialects, ranked search uses pg_trgm on Postgres.
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
+def search_indexes(table, prefix=(), trigram=()):
+    indexes = []
+    for column in prefix:
+        indexes += [
+            Index(f"ix_{table}_{column}_prefix", text(f'lower({column}) COLLATE "C"')).ddl_if(dialect="postgresql"),
+            Index(f"ix_{table}_{column}_prefix", text(f"lower({column})")).ddl_if(dialect="sqlite"),
+        ]
+    for column in trigram:
+        indexes.append(Index(f"ix_{table}_{column}_trgm", text(f"lower({column}) gin_trgm_ops"),
+                             postgresql_using="gin").ddl_if(dialect="postgresql"))
+    return indexes
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, nullable=False)
@@ -21,13 +44,15 @@ class User(Base):
     password = Column(String, nullable=False)
     role = Column(String, default=UserRole.USER.value)
     created_at = Column(
-        TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
     )
     posts = relationship("Post", back_populates="owner")
     comments = relationship("Comment", back_populates="user")
     owned_communities = relationship("Community", back_populates="owner")
     joined_communities = relationship("Community", secondary="community_membership", back_populates="members")
 
+    __table_args__ = tuple(search_indexes("users", prefix=["username"], trigram=["username"]))
+
 
 class Community(Base):
     __tablename__ = "communities"
@@ -38,6 +63,16 @@ class Community(Base):
     owner = relationship("User", back_populates="owned_communities")
     posts = relationship("Post", back_populates="community")    
     members = relationship("User", secondary="community_membership", back_populates="joined_communities")
+    # Denormalized, kept up to date by api.community_stats in the same
+    # transaction as the joins, leaves and posts that change them.
+    member_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    post_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    last_activity_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = tuple(search_indexes("communities", prefix=["name"], trigram=["name", "description"])) + (
+        Index("ix_communities_member_count_id", "member_count", "id"),
+        Index("ix_communities_last_activity_at_id", "last_activity_at", "id"),
+    )
 
 
 class CommunityMembership(Base):
@@ -45,6 +80,10 @@ class CommunityMembership(Base):
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     community_id = Column(Integer, ForeignKey("communities.id"), primary_key=True)
 
+    __table_args__ = (
+        Index("ix_community_membership_community_id_user_id", "community_id", "user_id"),
+    )
+
 
 class Post(Base):
     __tablename__ = "posts"
@@ -52,7 +91,10 @@ class Post(Base):
     content = Column(String, nullable=False)
     post_image = Column(String)
     created_at = Column(
-        TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now()
+    )
+    updated_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), default=datetime.now, onupdate=datetime.now
     )
     owner_id = Column(
         Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -60,6 +102,29 @@ class Post(Base):
     comments = relationship("Comment", back_populates="post")
     community_id = Column(Integer, ForeignKey("communities.id"))
     community = relationship("Community", back_populates="posts")
+    # Denormalized from `likes`, written in batches by api.likes.
+    like_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_community_id_created_at_id", "community_id", "created_at", "id"),
+        Index("ix_posts_updated_at_id", "updated_at", "id"),
+        Index("ix_posts_owner_id_created_at_id", "owner_id", "created_at", "id"),
+    )
+
+
+class TimelineEntry(Base):
+    # Precomputed home feed rows, one per (reader, post), written when a post
+    # is fanned out to the members of its community.
+    __tablename__ = "timeline_entries"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    community_id = Column(Integer, ForeignKey("communities.id", ondelete="CASCADE"))
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_timeline_entries_user_id_created_at_post_id", "user_id", "created_at", "post_id"),
+    )
 
 
 class Event(Base):
@@ -67,30 +132,59 @@ class Event(Base):
     id = Column(Integer, primary_key=True, nullable=False)
     title = Column(String, nullable=False)
     description = Column(Text)
-    event_date = Column(String)
+    # Stored in UTC; string values from before are converted by migration
+    # 0002.
+    event_date = Column(TIMESTAMP(timezone=True), nullable=False)
     location = Column(String)
     image = Column(String)
+    updated_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), default=datetime.now, onupdate=datetime.now
+    )
     comments = relationship("Comment", back_populates="event", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_events_event_date_id", "event_date", "id"),
+        Index("ix_events_updated_at_id", "updated_at", "id"),
+    )
+
 
 class Announcement(Base):
     __tablename__ = 'announcements'
     id = Column(Integer, primary_key=True, nullable=False)
     content = Column(String, nullable=False)
     created_at = Column(
-        TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
-    updated_at = Column(TIMESTAMP(timezone=True),
-                        nullable=False, server_default=text('now()'))
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now(), default=datetime.now, onupdate=datetime.now
+    )
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     owner = relationship("User")
 
+    __table_args__ = (
+        Index("ix_announcements_created_at_id", "created_at", "id"),
+        Index("ix_announcements_updated_at_id", "updated_at", "id"),
+    )
+
+
+class Tombstone(Base):
+    # Deleted posts, events and announcements, kept for delta sync clients
+    # (see api/sync.py) until SYNC_TOMBSTONE_RETENTION_DAYS.
+    __tablename__ = "tombstones"
+    resource = Column(String, primary_key=True)
+    resource_id = Column(Integer, primary_key=True)
+    deleted_at = Column(TIMESTAMP(timezone=True), nullable=False, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_tombstones_resource_deleted_at_resource_id", "resource", "deleted_at", "resource_id"),
+    )
+
 
 class Comment(Base):
     __tablename__ = "comments"
     id = Column(Integer, primary_key=True, nullable=False)
     content = Column(String, nullable=False)
     created_at = Column(
-        TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
+        TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
     event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"))
     event = relationship("Event", back_populates="comments", foreign_keys=[event_id])
     post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"))
@@ -100,6 +194,13 @@ class Comment(Base):
     reply_to_comment_id = Column(Integer, ForeignKey("comments.id"))
     replies = relationship("Comment", backref="parent_comment", remote_side=[id])
 
+    __table_args__ = (
+        Index("ix_comments_post_id_reply_to_comment_id_created_at_id", "post_id", "reply_to_comment_id", "created_at", "id"),
+        Index("ix_comments_event_id_reply_to_comment_id_created_at_id", "event_id", "reply_to_comment_id", "created_at", "id"),
+        Index("ix_comments_reply_to_comment_id_created_at_id", "reply_to_comment_id", "created_at", "id"),
+        Index("ix_comments_user_id", "user_id"),
+    )
+
 
 class Like(Base):
     __tablename__ = "likes"
@@ -107,4 +208,8 @@ class Like(Base):
         Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
     )
     post_id = Column(
-        Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
\ No newline at end of file
+        Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_likes_post_id", "post_id"),
+    )
\ No newline at end of file
@@ -1,25 +1,38 @@
-from typing import List
-from fastapi import APIRouter, Depends, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, Response, status
 from api.models.user import Announcement, User
-from api.schemas.user import CreateAnnouncement, AnnouncementResponse
-from database.db import get_db
+from api.schemas.user import CreateAnnouncement, AnnouncementResponse, SyncPage
+from api.loaders import ANNOUNCEMENT_PAGE_KEY, announcement_response_options
+from api.sync import announcement_sync
+from database.db import get_async_db, get_read_db
+from utils.http_cache import CachedRoute, cache_response, invalidate_responses
 from utils.oauth2 import get_current_user
-from sqlalchemy.orm import Session
+from utils.pagination import keyset_paginate, set_next_cursor
+from utils.serialization import SHAPE_NESTED, Shape, render
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
-announcement_router = APIRouter(prefix="/announcements", tags=["Announcements"])
+announcement_router = APIRouter(prefix="/announcements", tags=["Announcements"], route_class=CachedRoute)
 
 @announcement_router.post("/", status_code=status.HTTP_201_CREATED, response_model=AnnouncementResponse)
-def create_announcement(announcement_data: CreateAnnouncement, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    new_announcement = Announcement(owner_id=current_user.id, **announcement_data.dict())
+async def create_announcement(announcement_data: CreateAnnouncement, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    new_announcement = Announcement(owner=current_user, **announcement_data.dict())
 
     db.add(new_announcement)
-    db.commit()
-    db.refresh(new_announcement)
+    await db.commit()
+    await invalidate_responses("announcements")
 
     return new_announcement
 
 @announcement_router.get("/", response_model=List[AnnouncementResponse])
-def get_all_announcements(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    announcements = db.query(Announcement).offset(skip).limit(limit).all()
-    return announcements
\ No newline at end of file
+@cache_response("announcements")
+async def get_all_announcements(response: Response, skip: int = 0, limit: int = 10, cursor: Optional[str] = None, shape: Shape = SHAPE_NESTED, db: AsyncSession = Depends(get_read_db)):
+    query = select(Announcement).options(*announcement_response_options())
+    announcements = (await db.scalars(keyset_paginate(query, ANNOUNCEMENT_PAGE_KEY, cursor, skip, limit))).all()
+    set_next_cursor(response, announcements, ANNOUNCEMENT_PAGE_KEY, limit)
+    return render(List[AnnouncementResponse], announcements, response=response, shape=shape)
+
+@announcement_router.get("/sync", response_model=SyncPage[AnnouncementResponse])
+async def sync_announcements(since: Optional[str] = None, limit: int = Query(100, ge=1, le=500), db: AsyncSession = Depends(get_async_db)):
+    return render(SyncPage[AnnouncementResponse], await announcement_sync.changes(db, since, limit, announcement_response_options()))
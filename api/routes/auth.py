@@ -1,30 +1,38 @@
 from fastapi import status, HTTPException, Depends, APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from database.db import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import get_async_db
 from api.schemas.user import Token
 from api.models.user import User
 from utils.oauth2 import create_access_token
-from utils.utils import verify_password
+from utils.utils import verify_and_update_password_async
 
 
 auth_router = APIRouter(tags=["Authentication"])
 
 
 @auth_router.post("/login", status_code=status.HTTP_200_OK, response_model=Token)
-def login_user(
+async def login_user(
     user_credentials: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user = (
-        db.query(User)
-        .filter(User.email == user_credentials.username)
-        .first()
+    user = await db.scalar(
+        select(User)
+        .where(User.email == user_credentials.username)
     )
 
-    if not user or not verify_password(user_credentials.password, user.password):
+    if not user:
         raise HTTPException(status.HTTP_403_FORBIDDEN, detail=f"invalid credentials")
 
+    valid, new_hash = await verify_and_update_password_async(user_credentials.password, user.password)
+    if not valid:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail=f"invalid credentials")
+
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+
     access_token = create_access_token(data={"user_id": user.id})
 
     return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
@@ -0,0 +1,42 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models.user import Comment, User
+from api.schemas.user import CreateComment, CommentNode, CommentResponse
+from api.sync import touch_post
+from api.threads import comment_thread, insert_comment
+from database.db import get_async_db, get_read_db
+from utils.http_cache import invalidate_responses
+from utils.oauth2 import get_current_user
+from utils.pagination import NEXT_CURSOR_HEADER
+from utils.serialization import render
+
+
+comment_router = APIRouter(prefix="/comments", tags=["Comments"])
+
+@comment_router.post("/{comment_id}/replies", response_model=CommentResponse, status_code=status.HTTP_201_CREATED)
+async def create_reply(comment_id: int, comment: CreateComment, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    reply = await insert_comment(
+        db, current_user, comment.content, (Comment.id == comment_id,),
+        post_id=Comment.post_id, event_id=Comment.event_id, reply_to_comment_id=Comment.id,
+    )
+    if reply is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
+    if reply.post_id is not None:
+        await touch_post(db, reply.post_id)
+    await db.commit()
+    if reply.post_id is not None:
+        await invalidate_responses("posts", f"post:{reply.post_id}")
+    return reply
+
+@comment_router.get("/{comment_id}/replies", response_model=List[CommentNode])
+async def get_replies(comment_id: int, response: Response, limit: int = Query(10, ge=1, le=50), depth: int = Query(2, ge=0, le=10), replies: int = Query(3, ge=0, le=20), cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    parent = await db.scalar(select(Comment.id).where(Comment.id == comment_id))
+    if not parent:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
+
+    comments, next_cursor = await comment_thread(db, (Comment.reply_to_comment_id == comment_id,), limit, cursor, depth, replies)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return render(List[CommentNode], comments, response=response)
@@ -1,126 +1,219 @@
 from datetime import datetime
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Form, UploadFile, File
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from database.db import get_db
-from api.models.user import Community, Post, User, Comment
-from api.schemas.user import CreateCommunity, CommunityResponse, PostResponse, CreatePost, CreateComment, CommentResponse
-from utils.oauth2 import get_current_user
-from utils.s3 import upload_file_to_s3
-
-community_router = APIRouter(prefix="/communities", tags=["Communities"])
-
-@community_router.post("/", response_model=CommunityResponse)
-def create_community(community_create: CreateCommunity, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    community = db.query(Community).filter(Community.name == community_create.name).first()
-    if community:
+from typing import List, Literal, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status, Query, Form, UploadFile, File
+from sqlalchemy import exists, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import get_async_db, get_read_db, is_unique_violation
+from api.models.user import Community, CommunityMembership, Post, User, Comment
+from api.schemas.user import CreateCommunity, CommunitySummary, PostResponse, CreatePost, CreateComment, CommentNode, CommentResponse
+from api.search import SEARCH_RANKED, community_search, search
+from api.community_stats import record_activity, verify_community_stats
+from api.memberships import add_member, is_member, remove_member
+from api.feed import fan_out_post
+from api.fields import community_fields, post_fields
+from api.likes import annotate_likes
+from api.sync import touch_post
+from api.threads import comment_thread, insert_comment
+from api.loaders import COMMUNITY_PAGE_KEY, COMMUNITY_SORT_KEYS, POST_PAGE_KEY, community_summaries, community_summary, post_response_options, comment_response_options
+from utils.http_cache import CachedRoute, cache_response, invalidate_responses
+from utils.oauth2 import get_current_user, get_optional_user
+from utils.permissions import is_admin
+from utils.pagination import NEXT_CURSOR_HEADER, keyset_paginate, set_next_cursor
+from utils.serialization import SHAPE_NESTED, Shape, render
+from utils.storage import schedule_upload
+
+community_router = APIRouter(prefix="/communities", tags=["Communities"], route_class=CachedRoute)
+
+@community_router.post("/", response_model=CommunitySummary)
+async def create_community(community_create: CreateCommunity, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    new_community = Community(owner=current_user, last_activity_at=datetime.now(), **community_create.dict(exclude={"owner"}))
+    db.add(new_community)
+    try:
+        await db.commit()
+    except IntegrityError as error:
+        await db.rollback()
+        if not is_unique_violation(error):
+            raise
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="community already exists")
-    new_community = Community(owner_id=current_user.id, **community_create.dict(exclude={"owner"}))
-    db.add(new_community)
-    db.commit()
-    db.refresh(new_community)
 
-    return new_community
+    # A new community has no members or posts yet, so its summary needs
+    # nothing the insert didn't already return.
+    return community_summary(new_community, [])
 
 @community_router.post("/join/{community_id}", status_code=status.HTTP_202_ACCEPTED)
-def join_community(community_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    community = db.query(Community).filter(Community.id == community_id).first()
-    if community is None:
+async def join_community(community_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    if not await db.scalar(select(exists().where(Community.id == community_id))):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Community not found")
-    
-    if community in current_user.joined_communities:
+
+    if not await add_member(db, community_id, current_user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User is already a member of this community")
-    
-    community.members.append(current_user)
-    db.commit()
-    db.refresh(community)
+    await invalidate_responses(f"community:{community_id}")
 
     return {"message": "User successfully joined the community"}
-    
 
-@community_router.get("/{community_id}", response_model=CommunityResponse)
-def get_community(community_id: int, db: Session = Depends(get_db)):
-    community = db.query(Community).filter(Community.id == community_id).first()
-    if community is None:
+@community_router.post("/leave/{community_id}", status_code=status.HTTP_202_ACCEPTED)
+async def leave_community(community_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    if not await remove_member(db, community_id, current_user.id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User is not a member of this community")
+    await invalidate_responses(f"community:{community_id}")
+
+    return {"message": "User successfully left the community"}
+
+@community_router.get("/{community_id}", response_model=CommunitySummary)
+@cache_response("community:{community_id}")
+async def get_community(community_id: int, fields: Optional[str] = None, expand: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    selection = community_fields.parse(fields, expand)
+    if selection:
+        rows = (await db.execute(community_fields.query(selection).where(Community.id == community_id))).all()
+        if not rows:
+            raise HTTPException(status_code=404, detail="Community not found")
+        return await community_fields.render(db, rows, selection, many=False)
+
+    communities = await community_summaries(db, select(Community).where(Community.id == community_id))
+    if not communities:
         raise HTTPException(status_code=404, detail="Community not found")
-    
-    return community
-
-@community_router.get("/", response_model=List[CommunityResponse])
-def get_all_communities(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    communities = db.query(Community).offset(skip).limit(limit).all()
-    return communities
 
-@community_router.get("/my_communities/", response_model=List[CommunityResponse])
-def get_user_communities(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    user_communities = current_user.joined_communities
-    return user_communities
-
-def is_user_member_of_community(community: Community, user: User) -> bool:
-    return user in community.members
+    return render(CommunitySummary, communities[0])
+
+@community_router.get("/", response_model=List[CommunitySummary])
+async def get_all_communities(response: Response, skip: int = 0, limit: int = 10, cursor: Optional[str] = None, sort: Optional[Literal["largest", "active"]] = None, shape: Shape = SHAPE_NESTED, fields: Optional[str] = None, expand: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    page_key = COMMUNITY_SORT_KEYS[sort] if sort else COMMUNITY_PAGE_KEY
+    selection = community_fields.parse(fields, expand, shape)
+    if selection:
+        query = keyset_paginate(community_fields.query(selection), page_key, cursor, skip, limit, descending=bool(sort))
+        rows = (await db.execute(query)).all()
+        set_next_cursor(response, [row[0] for row in rows], page_key, limit)
+        return await community_fields.render(db, rows, selection, response=response)
+
+    query = keyset_paginate(select(Community), page_key, cursor, skip, limit, descending=bool(sort))
+    communities = await community_summaries(db, query)
+    set_next_cursor(response, communities, page_key, limit)
+    return render(List[CommunitySummary], communities, response=response, shape=shape)
+
+@community_router.get("/my_communities/", response_model=List[CommunitySummary])
+async def get_user_communities(current_user: User = Depends(get_current_user), shape: Shape = SHAPE_NESTED, db: AsyncSession = Depends(get_read_db)):
+    user_communities = await community_summaries(
+        db,
+        select(Community)
+        .join(CommunityMembership, CommunityMembership.community_id == Community.id)
+        .where(CommunityMembership.user_id == current_user.id)
+    )
+    return render(List[CommunitySummary], user_communities, shape=shape)
 
 @community_router.post("/{community_id}/posts", response_model=PostResponse, status_code=status.HTTP_201_CREATED)
-def create_community_post(community_id: int, content: str = Form(...), file: UploadFile = File(None), current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    community = db.query(Community).filter(Community.id == community_id).first()
-    if not community:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Community not found")
-
-    if not is_user_member_of_community(community, current_user):
+async def create_community_post(community_id: int, background_tasks: BackgroundTasks, content: str = Form(...), file: UploadFile = File(None), current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    # Memberships are cached, and a member's community exists; the lookup
+    # is only needed to tell a missing community from a non-member.
+    if not await is_member(db, community_id, current_user.id):
+        if not await db.scalar(select(exists().where(Community.id == community_id))):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Community not found")
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this community")
 
     if file:
-        image_url = upload_file_to_s3(file)
+        image_url = await schedule_upload(file, background_tasks)
     else:
         image_url = None
 
-    new_post = Post(content=content, post_image=image_url, created_at=datetime.now(), owner=current_user, community_id=community_id)
+    new_post = Post(content=content, post_image=image_url, created_at=datetime.now(), owner=current_user, community_id=community_id, comments=[])
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await db.flush()
+    await fan_out_post(db, new_post)
+    await record_activity(db, community_id, posts=1, at=new_post.created_at)
+    await db.commit()
+    await invalidate_responses("posts", f"community:{community_id}")
     return new_post
 
+@community_router.get("/{community_id}/posts", response_model=List[PostResponse])
+async def get_community_posts(community_id: int, response: Response, skip: int = 0, limit: int = 10, cursor: Optional[str] = None, shape: Shape = SHAPE_NESTED, fields: Optional[str] = None, expand: Optional[str] = None, current_user: Optional[User] = Depends(get_optional_user), db: AsyncSession = Depends(get_read_db)):
+    community = await db.scalar(select(Community).where(Community.id == community_id))
+    if not community:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Community not found")
+    selection = post_fields.parse(fields, expand, shape)
+    if selection:
+        query = keyset_paginate(post_fields.query(selection).where(Post.community_id == community_id), POST_PAGE_KEY, cursor, skip, limit)
+        rows = (await db.execute(query)).all()
+        set_next_cursor(response, [row[0] for row in rows], POST_PAGE_KEY, limit)
+        return await post_fields.render(db, rows, selection, response=response)
+
+    query = select(Post).options(*post_response_options()).where(Post.community_id == community_id)
+    posts = (await db.scalars(keyset_paginate(query, POST_PAGE_KEY, cursor, skip, limit))).all()
+    set_next_cursor(response, posts, POST_PAGE_KEY, limit)
+    viewer_fields = await annotate_likes(db, posts, current_user and current_user.id)
+    return render(List[PostResponse], posts, response=response, shape=shape, computed=viewer_fields)
+
 @community_router.get("/{community_id}/posts/{post_id}", response_model=PostResponse)
-def get_community_post(community_id: int, post_id: int, db: Session = Depends(get_db)):
-    community = db.query(Community).filter(Community.id == community_id).first()
+async def get_community_post(community_id: int, post_id: int, fields: Optional[str] = None, expand: Optional[str] = None, current_user: Optional[User] = Depends(get_optional_user), db: AsyncSession = Depends(get_read_db)):
+    community = await db.scalar(select(Community).where(Community.id == community_id))
     if not community:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Community not found")
-    post = db.query(Post).filter(Post.id == post_id, Post.community_id == community_id).first()
+    selection = post_fields.parse(fields, expand)
+    if selection:
+        rows = (await db.execute(post_fields.query(selection).where(Post.id == post_id, Post.community_id == community_id))).all()
+        if not rows:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found in the community")
+        return await post_fields.render(db, rows, selection, many=False)
+
+    post = await db.scalar(select(Post).options(*post_response_options()).where(Post.id == post_id, Post.community_id == community_id))
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found in the community")
-    return post
+    viewer_fields = await annotate_likes(db, [post], current_user and current_user.id)
+    return render(PostResponse, post, computed=viewer_fields)
 
 @community_router.post("/{community_id}/posts/{post_id}/comments", response_model=CommentResponse, status_code=status.HTTP_201_CREATED)
-def create_community_post_comment(community_id: int, comment: CreateComment, post_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    community = db.query(Community).filter(Community.id == community_id).first()
-    if not community:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Community not found")
-    post = db.query(Post).filter(Post.id == post_id).first()
-    if not post:
+async def create_community_post_comment(community_id: int, comment: CreateComment, post_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    new_comment = await insert_comment(db, current_user, comment.content, (Post.id == post_id, Post.community_id == community_id), post_id=Post.id)
+    if new_comment is None:
+        if not await db.scalar(select(exists().where(Community.id == community_id))):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Community not found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
-    
-    new_comment = Comment(content=comment.content, created_at=datetime.now(), post_id=post_id, user_id=current_user.id)
-    db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
+    await touch_post(db, post_id)
+    await db.commit()
+    await invalidate_responses("posts", f"post:{post_id}")
     return new_comment
 
 @community_router.get("/{community_id}/posts/{post_id}/comments", response_model=list[CommentResponse], status_code=status.HTTP_200_OK)
-def get_community_post_comments(community_id: int, post_id: int, db: Session = Depends(get_db)):
-    community = db.query(Community).filter(Community.id == community_id).first()
+async def get_community_post_comments(community_id: int, post_id: int, shape: Shape = SHAPE_NESTED, db: AsyncSession = Depends(get_read_db)):
+    community = await db.scalar(select(Community).where(Community.id == community_id))
     if not community:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Community not found")
-    post = db.query(Post).filter(Post.id == post_id, Post.community_id == community_id).first()
+    post = await db.scalar(select(Post).where(Post.id == post_id, Post.community_id == community_id))
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
 
-    comments = db.query(Comment).filter(Comment.post_id == post_id).all()
-    return comments
+    comments = (await db.scalars(select(Comment).options(*comment_response_options()).where(Comment.post_id == post_id))).all()
+    return render(List[CommentResponse], comments, shape=shape)
 
-@community_router.get("/all/search", response_model=List[CommunityResponse])
-def search_communities(name: str = Query(..., min_length=1), db: Session = Depends(get_db)):
-    communities = db.query(Community).filter(func.lower(Community.name).contains(func.lower(name))).all()
-    if not communities:
+@community_router.get("/{community_id}/posts/{post_id}/comments/thread", response_model=List[CommentNode])
+async def get_community_post_comment_thread(community_id: int, post_id: int, response: Response, limit: int = Query(10, ge=1, le=50), depth: int = Query(3, ge=0, le=10), replies: int = Query(3, ge=0, le=20), cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    post = await db.scalar(select(Post).where(Post.id == post_id, Post.community_id == community_id))
+    if not post:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
+
+    comments, next_cursor = await comment_thread(db, (Comment.post_id == post_id, Comment.reply_to_comment_id.is_(None)), limit, cursor, depth, replies)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return render(List[CommentNode], comments, response=response)
+
+@community_router.post("/stats/verify", dependencies=[Depends(is_admin)])
+async def verify_stats():
+    return {"repaired": await verify_community_stats()}
+
+@community_router.get("/all/search", response_model=List[CommunitySummary])
+async def search_communities(
+    response: Response,
+    name: str = Query(..., min_length=1),
+    mode: Literal["ranked", "prefix"] = SEARCH_RANKED,
+    limit: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    ids, next_cursor = await search(db, community_search, name, mode, limit, cursor)
+    found = {community["id"]: community for community in await community_summaries(db, select(Community).where(Community.id.in_(ids)))}
+    communities = [found[id] for id in ids if id in found]
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if not communities and not cursor:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No communities found")
-    return communities
\ No newline at end of file
+    return render(List[CommunitySummary], communities, response=response)
\ No newline at end of file
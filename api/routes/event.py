@@ -1,29 +1,45 @@
-from datetime import datetime
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Response, status, Form, UploadFile, File
-from sqlalchemy.orm import Session
+from datetime import date, datetime, time, timezone
+from typing import List, Optional, Union
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status, Form, UploadFile, File
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.models.user import Event, User, Comment
-from api.schemas.user import CreateEvent, EventResponse, CreateComment, CommentResponse
-from database.db import get_db
+from api.schemas.user import CreateEvent, EventCalendar, EventResponse, SyncPage, CreateComment, CommentNode, CommentResponse
+from api.fields import event_fields
+from api.loaders import EVENT_PAGE_KEY, comment_response_options
+from api.sync import event_sync
+from api.threads import comment_thread, insert_comment
+from database.db import get_async_db, get_read_db
+from utils.http_cache import CachedRoute, cache_response, expire_response, invalidate_responses
 from utils.oauth2 import get_current_user
-from utils.s3 import upload_file_to_s3
+from utils.pagination import NEXT_CURSOR_HEADER, keyset_paginate, set_next_cursor
+from utils.serialization import SHAPE_NESTED, Shape, render
+from utils.storage import schedule_upload
 
 
-event_router = APIRouter(prefix="/events", tags=["Events"])
+event_router = APIRouter(prefix="/events", tags=["Events"], route_class=CachedRoute)
+
+
+def utc_datetime(value: Union[datetime, date]) -> datetime:
+    if isinstance(value, datetime):
+        return CreateEvent.event_date_utc(value)
+    return datetime.combine(value, time.min, timezone.utc)
+
 
 @event_router.post("/", status_code=status.HTTP_201_CREATED, response_model=EventResponse)
-def create_event(
+async def create_event(
+    background_tasks: BackgroundTasks,
     title: str = Form(...),
     description: str = Form(...),
-    event_date: str = Form(...),
+    event_date: datetime = Form(...),
     location: str = Form(...),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     image_url = None
     if image:
-        image_url = upload_file_to_s3(image)
+        image_url = await schedule_upload(image, background_tasks)
 
     event_data = CreateEvent(
         title=title,
@@ -35,61 +51,112 @@ def create_event(
 
     new_event = Event(**event_data.dict())
     db.add(new_event)
-    db.commit()
-    db.refresh(new_event)
-
-    response_event = EventResponse(
-        id=new_event.id,
-        title=new_event.title,
-        description=new_event.description,
-        event_date=new_event.event_date,
-        location=new_event.location,
-        image=new_event.image,
-        comments=[]
+    await db.commit()
+    await invalidate_responses("events")
+
+    return render(EventResponse, new_event, status_code=status.HTTP_201_CREATED)
+
+@event_router.get("/calendar", response_model=EventCalendar)
+@cache_response("events")
+async def get_event_calendar(year: int = Query(..., ge=1, le=9998), month: int = Query(..., ge=1, le=12), db: AsyncSession = Depends(get_read_db)):
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    if db.bind.dialect.name == "postgresql":
+        day = func.extract("day", func.timezone("UTC", Event.event_date))
+    else:
+        day = func.strftime("%d", Event.event_date)
+
+    rows = await db.execute(
+        select(day, func.count()).where(Event.event_date >= start, Event.event_date < end).group_by(day)
     )
+    return render(EventCalendar, {"year": year, "month": month, "days": {int(day): count for day, count in rows}})
 
-    return response_event
+@event_router.get("/sync", response_model=SyncPage[EventResponse])
+async def sync_events(since: Optional[str] = None, limit: int = Query(100, ge=1, le=500), db: AsyncSession = Depends(get_async_db)):
+    return render(SyncPage[EventResponse], await event_sync.changes(db, since, limit))
 
 @event_router.get("/{event_id}", response_model=EventResponse)
-def get_event(event_id: int, response: Response, db: Session = Depends(get_db)):
-    event = db.query(Event).filter(Event.id == event_id).first()
+@cache_response("event:{event_id}")
+async def get_event(event_id: int, response: Response, fields: Optional[str] = None, expand: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    selection = event_fields.parse(fields, expand)
+    if selection:
+        rows = (await db.execute(event_fields.query(selection).where(Event.id == event_id))).all()
+        if not rows:
+            raise HTTPException(status_code=404, detail="Event not found")
+        return await event_fields.render(db, rows, selection, many=False)
+
+    event = await db.scalar(select(Event).where(Event.id == event_id))
     if event is None:
         raise HTTPException(status_code=404, detail="Event not found")
-    
-    response_event = EventResponse(
-        id=event.id,
-        title=event.title,
-        description=event.description,
-        event_date=event.event_date,
-        location=event.location,
-        image=event.image,
-        comments=[]
-    )
 
-    return response_event
+    return render(EventResponse, event)
 
 @event_router.get("/", response_model=List[EventResponse])
-def get_all_events(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    events = db.query(Event).offset(skip).limit(limit).all()
-    return events
+@cache_response("events")
+async def get_all_events(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    starts_from: Optional[Union[datetime, date]] = Query(None, alias="from"),
+    to: Optional[Union[datetime, date]] = None,
+    upcoming: bool = False,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    # Ordered by start time. from is inclusive and to exclusive; either can
+    # be a date (midnight) or a datetime, UTC unless it has an offset.
+    criteria = []
+    if starts_from:
+        criteria.append(Event.event_date >= utc_datetime(starts_from))
+    if to:
+        criteria.append(Event.event_date < utc_datetime(to))
+    if upcoming:
+        criteria.append(Event.event_date >= datetime.now(timezone.utc))
+    # An upcoming listing goes stale when its first event starts, with no
+    # write to invalidate it.
+
+    selection = event_fields.parse(fields, expand)
+    if selection:
+        query = keyset_paginate(event_fields.query(selection).where(*criteria), EVENT_PAGE_KEY, cursor, skip, limit, descending=False)
+        rows = (await db.execute(query)).all()
+        set_next_cursor(response, [row[0] for row in rows], EVENT_PAGE_KEY, limit)
+        if upcoming and rows:
+            expire_response(response, utc_datetime(rows[0][0].event_date))
+        return await event_fields.render(db, rows, selection, response=response)
+
+    query = keyset_paginate(select(Event).where(*criteria), EVENT_PAGE_KEY, cursor, skip, limit, descending=False)
+    events = (await db.scalars(query)).all()
+    set_next_cursor(response, events, EVENT_PAGE_KEY, limit)
+    if upcoming and events:
+        expire_response(response, utc_datetime(events[0].event_date))
+    return render(List[EventResponse], events, response=response)
 
 @event_router.post("/{event_id}/comments", response_model=CommentResponse, status_code=status.HTTP_201_CREATED)
-def create_event_comment(comment: CreateComment, event_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    event = db.query(Event).filter(Event.id == event_id).first()
-    if not event:
+async def create_event_comment(comment: CreateComment, event_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    new_comment = await insert_comment(db, current_user, comment.content, (Event.id == event_id,), event_id=Event.id)
+    if new_comment is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
-    
-    new_comment = Comment(content=comment.content, created_at=datetime.now(), event_id=event_id, user_id=current_user.id)
-    db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
+    await db.commit()
     return new_comment
 
 @event_router.get("/{event_id}/comments", response_model=List[CommentResponse], status_code=status.HTTP_200_OK)
-def get_event_comments(event_id: int, db: Session = Depends(get_db)):
-    event = db.query(Event).filter(Event.id == event_id).first()
+async def get_event_comments(event_id: int, shape: Shape = SHAPE_NESTED, db: AsyncSession = Depends(get_read_db)):
+    event = await db.scalar(select(Event).where(Event.id == event_id))
     if not event:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
     
-    comments = db.query(Comment).filter(Comment.event_id == event_id).all()
-    return comments
\ No newline at end of file
+    comments = (await db.scalars(select(Comment).options(*comment_response_options()).where(Comment.event_id == event_id))).all()
+    return render(List[CommentResponse], comments, shape=shape)
+
+@event_router.get("/{event_id}/comments/thread", response_model=List[CommentNode])
+async def get_event_comment_thread(event_id: int, response: Response, limit: int = Query(10, ge=1, le=50), depth: int = Query(3, ge=0, le=10), replies: int = Query(3, ge=0, le=20), cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    event = await db.scalar(select(Event).where(Event.id == event_id))
+    if not event:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
+
+    comments, next_cursor = await comment_thread(db, (Comment.event_id == event_id, Comment.reply_to_comment_id.is_(None)), limit, cursor, depth, replies)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return render(List[CommentNode], comments, response=response)
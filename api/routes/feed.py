@@ -0,0 +1,29 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models.user import Post, User
+from api.schemas.user import PostResponse
+from api.feed import feed_page
+from api.likes import annotate_likes
+from api.loaders import post_response_options
+from api.memberships import get_user_memberships
+from database.db import get_read_db
+from utils.oauth2 import get_current_user
+from utils.pagination import NEXT_CURSOR_HEADER
+from utils.serialization import SHAPE_NESTED, Shape, render
+
+
+feed_router = APIRouter(prefix="/feed", tags=["Feed"])
+
+@feed_router.get("/", response_model=List[PostResponse])
+async def get_feed(response: Response, limit: int = Query(10, ge=1, le=50), cursor: Optional[str] = None, current_user: User = Depends(get_current_user), shape: Shape = SHAPE_NESTED, db: AsyncSession = Depends(get_read_db)):
+    memberships = await get_user_memberships(db, current_user.id)
+    ids, next_cursor = await feed_page(db, current_user.id, memberships, limit, cursor)
+
+    found = {post.id: post for post in await db.scalars(select(Post).options(*post_response_options()).where(Post.id.in_(ids)))}
+    posts = [found[id] for id in ids if id in found]
+    viewer_fields = await annotate_likes(db, posts, current_user.id)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return render(List[PostResponse], posts, response=response, shape=shape, computed=viewer_fields)
@@ -1,59 +1,128 @@
 from datetime import datetime
-from typing import List
-from fastapi import APIRouter, Depends, Form, HTTPException, Response, UploadFile, status, File
-from sqlalchemy.orm import Session
+from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, Form, HTTPException, Query, Response, UploadFile, status, File
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from api.models.user import Post, User, Comment
-from api.schemas.user import CreatePost, PostResponse, CreateComment, CommentResponse
-from database.db import get_db
-from utils.oauth2 import get_current_user
-from utils.s3 import upload_file_to_s3
+from api.schemas.user import CreatePost, PostResponse, CreateComment, CommentNode, CommentResponse, SyncPage
+from api.feed import fan_out_post
+from api.fields import post_fields
+from api.likes import annotate_likes, like_post, reconcile_like_counts, unlike_post
+from api.sync import post_sync, touch_post
+from api.loaders import POST_PAGE_KEY, post_response_options, comment_response_options
+from api.threads import comment_thread, insert_comment
+from database.db import get_async_db, get_read_db
+from utils.http_cache import CachedRoute, cache_response, invalidate_responses
+from utils.oauth2 import get_current_user, get_optional_user
+from utils.permissions import is_admin
+from utils.pagination import NEXT_CURSOR_HEADER, keyset_paginate, set_next_cursor
+from utils.serialization import SHAPE_NESTED, Shape, render
+from utils.storage import schedule_upload
 
 
-post_router = APIRouter(prefix="/posts", tags=["Post"])
+post_router = APIRouter(prefix="/posts", tags=["Post"], route_class=CachedRoute)
 
 @post_router.post("/", response_model=PostResponse, status_code=status.HTTP_201_CREATED)
-def create_post(content: str = Form(...), file: UploadFile = File(None), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def create_post(background_tasks: BackgroundTasks, content: str = Form(...), file: UploadFile = File(None), db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
     if file:
-        image_url = upload_file_to_s3(file)
+        image_url = await schedule_upload(file, background_tasks)
     else:
         image_url = None
 
-    new_post = Post(content=content, post_image=image_url, created_at=datetime.now(), owner=current_user)
+    new_post = Post(content=content, post_image=image_url, created_at=datetime.now(), owner=current_user, comments=[])
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await db.flush()
+    await fan_out_post(db, new_post)
+    await db.commit()
+    await invalidate_responses("posts")
 
     return new_post
 
+@post_router.get("/sync", response_model=SyncPage[PostResponse])
+async def sync_posts(since: Optional[str] = None, limit: int = Query(100, ge=1, le=500), current_user: Optional[User] = Depends(get_optional_user), db: AsyncSession = Depends(get_async_db)):
+    page = await post_sync.changes(db, since, limit, post_response_options())
+    viewer_fields = await annotate_likes(db, page["changes"], current_user and current_user.id)
+    return render(SyncPage[PostResponse], page, computed=viewer_fields)
+
 @post_router.get("/{post_id}/", response_model=PostResponse)
-def get_post(post_id: int, response: Response, db: Session = Depends(get_db)):
-    post = db.query(Post).filter(Post.id == post_id).first()
+@cache_response("post:{post_id}", per_viewer=True)
+async def get_post(post_id: int, response: Response, fields: Optional[str] = None, expand: Optional[str] = None, current_user: Optional[User] = Depends(get_optional_user), db: AsyncSession = Depends(get_read_db)):
+    selection = post_fields.parse(fields, expand)
+    if selection:
+        rows = (await db.execute(post_fields.query(selection).where(Post.id == post_id))).all()
+        if not rows:
+            raise HTTPException(status_code=404, detail="Post not found")
+        return await post_fields.render(db, rows, selection, many=False)
+
+    post = await db.scalar(select(Post).options(*post_response_options()).where(Post.id == post_id))
     if post is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    return post
+    viewer_fields = await annotate_likes(db, [post], current_user and current_user.id)
+    return render(PostResponse, post, computed=viewer_fields)
 
 @post_router.get("/", response_model=List[PostResponse])
-def get_all_posts(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    posts = db.query(Post).offset(skip).limit(limit).all()
-    return posts
+@cache_response("posts", per_viewer=True)
+async def get_all_posts(response: Response, skip: int = 0, limit: int = 10, cursor: Optional[str] = None, shape: Shape = SHAPE_NESTED, fields: Optional[str] = None, expand: Optional[str] = None, current_user: Optional[User] = Depends(get_optional_user), db: AsyncSession = Depends(get_read_db)):
+    selection = post_fields.parse(fields, expand, shape)
+    if selection:
+        rows = (await db.execute(keyset_paginate(post_fields.query(selection), POST_PAGE_KEY, cursor, skip, limit))).all()
+        set_next_cursor(response, [row[0] for row in rows], POST_PAGE_KEY, limit)
+        return await post_fields.render(db, rows, selection, response=response)
 
-@post_router.post("/{post_id}/comments", response_model=CommentResponse, status_code=status.HTTP_201_CREATED)
-def create_user_post_comment(comment: CreateComment, post_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    post = db.query(Post).filter(Post.id == post_id).first()
+    query = select(Post).options(*post_response_options())
+    posts = (await db.scalars(keyset_paginate(query, POST_PAGE_KEY, cursor, skip, limit))).all()
+    set_next_cursor(response, posts, POST_PAGE_KEY, limit)
+    viewer_fields = await annotate_likes(db, posts, current_user and current_user.id)
+    return render(List[PostResponse], posts, response=response, shape=shape, computed=viewer_fields)
+
+@post_router.post("/{post_id}/like", status_code=status.HTTP_202_ACCEPTED)
+async def like(post_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    post = await db.scalar(select(Post.id).where(Post.id == post_id))
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
-    
-    new_comment = Comment(content=comment.content, post_id=post_id, user_id=current_user.id)
-    db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
+
+    if not await like_post(db, post_id, current_user.id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Post already liked")
+    await invalidate_responses(f"viewer:{current_user.id}")
+    return {"message": "Post liked"}
+
+@post_router.delete("/{post_id}/like", status_code=status.HTTP_202_ACCEPTED)
+async def unlike(post_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    if not await unlike_post(db, post_id, current_user.id):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Post is not liked")
+    await invalidate_responses(f"viewer:{current_user.id}")
+    return {"message": "Post unliked"}
+
+@post_router.post("/likes/reconcile", dependencies=[Depends(is_admin)])
+async def reconcile_likes():
+    return {"repaired": await reconcile_like_counts()}
+
+@post_router.post("/{post_id}/comments", response_model=CommentResponse, status_code=status.HTTP_201_CREATED)
+async def create_user_post_comment(comment: CreateComment, post_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    new_comment = await insert_comment(db, current_user, comment.content, (Post.id == post_id,), post_id=Post.id)
+    if new_comment is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
+    await touch_post(db, post_id)
+    await db.commit()
+    await invalidate_responses("posts", f"post:{post_id}")
     return new_comment
 
 @post_router.get("/{post_id}/comments", response_model=list[CommentResponse], status_code=status.HTTP_200_OK)
-def get_user_post_comments(post_id: int, db: Session = Depends(get_db)):
-    post = db.query(Post).filter(Post.id == post_id).first()
+async def get_user_post_comments(post_id: int, shape: Shape = SHAPE_NESTED, db: AsyncSession = Depends(get_read_db)):
+    post = await db.scalar(select(Post).where(Post.id == post_id))
+    if not post:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
+
+    comments = (await db.scalars(select(Comment).options(*comment_response_options()).where(Comment.post_id == post_id))).all()
+    return render(List[CommentResponse], comments, shape=shape)
+
+@post_router.get("/{post_id}/comments/thread", response_model=List[CommentNode])
+async def get_post_comment_thread(post_id: int, response: Response, limit: int = Query(10, ge=1, le=50), depth: int = Query(3, ge=0, le=10), replies: int = Query(3, ge=0, le=20), cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    post = await db.scalar(select(Post).where(Post.id == post_id))
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
 
-    comments = db.query(Comment).filter(Comment.post_id == post_id).all()
-    return comments
\ No newline at end of file
+    comments, next_cursor = await comment_thread(db, (Comment.post_id == post_id, Comment.reply_to_comment_id.is_(None)), limit, cursor, depth, replies)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return render(List[CommentNode], comments, response=response)
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, HTTPException, status
+from utils.storage import upload_status
+
+
+upload_router = APIRouter(prefix="/uploads", tags=["Uploads"])
+
+@upload_router.get("/{key:path}", status_code=status.HTTP_200_OK)
+def get_upload_status(key: str):
+    upload = upload_status.get(key)
+    if upload is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return {"key": key, "status": upload}
\ No newline at end of file
@@ -1,52 +1,84 @@
-from typing import List
-from fastapi import status, HTTPException, Depends, APIRouter, Query
+from typing import List, Literal, Optional
+from fastapi import status, HTTPException, Depends, APIRouter, Query, Response
 from api.schemas.user import SignUp, Profile
-from database.db import get_db
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from utils.utils import hash_password
+from database.db import get_async_db, get_read_db, is_unique_violation
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.utils import hash_password_async
 from api.models.user import User
+from api.fields import user_fields
+from api.search import SEARCH_RANKED, search, user_search
 from utils.oauth2 import get_current_user
+from utils.pagination import NEXT_CURSOR_HEADER
 
 
 user_router = APIRouter(prefix="/users", tags=["User"])
 
 @user_router.post("/", status_code=status.HTTP_201_CREATED, response_model=Profile)
-def create_user(user: SignUp, db: Session = Depends(get_db)):
-    user_data = db.query(User).filter(User.email == user.email).first()
-    user_name = db.query(User).filter(User.username == user.username).first()
-    if user_data:
+async def create_user(user: SignUp, db: AsyncSession = Depends(get_async_db)):
+    # Checked before hashing so repeated duplicate sign-ups can't fill the
+    # password pool and turn away logins; the unique constraint still
+    # settles races between the check and the insert.
+    if await db.scalar(select(User.id).where(or_(User.email == user.email, User.username == user.username)).limit(1)):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="user already exists")
-    if user_name:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail="user already exists")
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password_async(user.password)
     user.password = hashed_password
     new_user = User(**user.dict())
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    try:
+        await db.commit()
+    except IntegrityError as error:
+        await db.rollback()
+        if not is_unique_violation(error):
+            raise
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="user already exists")
     return new_user
 
 @user_router.get("/{id}", response_model=Profile)
-async def get_profile(id: int, db: Session = Depends(get_db)):
-    user_details = db.query(User).filter(User.id == id).first()
+async def get_profile(id: int, fields: Optional[str] = None, expand: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
+    selection = user_fields.parse(fields, expand)
+    if selection:
+        rows = (await db.execute(user_fields.query(selection).where(User.id == id))).all()
+        if not rows:
+            raise HTTPException(status_code=404)
+        return await user_fields.render(db, rows, selection, many=False)
+
+    user_details = await db.scalar(select(User).where(User.id == id))
     if user_details:
         return user_details
     else:
         raise HTTPException(status_code=404)
 
 @user_router.get("/profile/me", status_code=status.HTTP_200_OK, response_model=Profile)
-def me(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def me(current_user: User = Depends(get_current_user)):
     if not current_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
     return current_user
 
 @user_router.get("/all/search", status_code=status.HTTP_200_OK, response_model=List[Profile])
-def search_user(username: str = Query(..., min_length=1), db: Session = Depends(get_db)):
-    users = db.query(User).filter(func.lower(User.username).contains(func.lower(username))).all()
-    if not users:
+async def search_user(
+    response: Response,
+    username: str = Query(..., min_length=1),
+    mode: Literal["ranked", "prefix"] = SEARCH_RANKED,
+    limit: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+):
+    selection = user_fields.parse(fields, expand)
+    ids, next_cursor = await search(db, user_search, username, mode, limit, cursor)
+    query = user_fields.query(selection) if selection else select(User)
+    found = {row[0].id: row for row in (await db.execute(query.where(User.id.in_(ids)))).all()}
+    rows = [found[id] for id in ids if id in found]
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if not rows and not cursor:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No users found")
-    return users
\ No newline at end of file
+    if selection:
+        return await user_fields.render(db, rows, selection, response=response)
+    return [row[0] for row in rows]
\ No newline at end of file
@@ -1,7 +1,8 @@
 from fastapi import Form
-from pydantic import BaseModel, EmailStr, Field, conint
-from typing import List, Optional
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field, computed_field, conint, field_validator
+from typing import ClassVar, Dict, Generic, List, Optional, TypeVar
+from datetime import datetime, timezone
+from utils.images import image_variants
 
 
 class Profile(BaseModel):
@@ -13,6 +14,11 @@ class Profile(BaseModel):
     username: str = Field(...)
     role: str = Field(...)
 
+    @computed_field
+    @property
+    def profile_image_variants(self) -> Optional[Dict[str, str]]:
+        return image_variants(self.profile_image)
+
     class Config:
         from_attributes = True
 
@@ -43,17 +49,37 @@ class CreateComment(BaseModel):
         from_attributes = True
 
 
-class CommentResponse(BaseModel):
+class CommentBase(BaseModel):
     id: int
     content: str
     created_at: datetime
     event_id: Optional[int]
     post_id: Optional[int]
-    user: Profile
-    reply_to_comment_id: Optional[int]
 
     class Config:
         from_attributes = True
+
+
+class CommentResponse(CommentBase):
+    user: Profile
+    reply_to_comment_id: Optional[int]
+
+
+class CommentNode(CommentResponse):
+    # One comment of a thread with up to `replies` children loaded. When
+    # has_more_replies is set, the rest come from /comments/{id}/replies,
+    # starting after replies_cursor (or from the first reply when it's null).
+    reply_count: int
+    has_more_replies: bool
+    replies_cursor: Optional[str]
+    replies: List["CommentNode"]
+
+
+class NormalizedComment(CommentBase):
+    references: ClassVar[Dict[str, str]] = {"user_id": "user"}
+
+    user_id: int
+    reply_to_comment_id: Optional[int]
     
 
 class CreatePost(BaseModel):
@@ -65,25 +91,50 @@ class CreatePost(BaseModel):
         from_attributes = True
 
 
-class PostResponse(BaseModel):
+class PostBase(BaseModel):
     id: int
     content: str
     post_image: Optional[str] = Field(None)
     created_at: datetime
-    owner: Profile
-    comments: List[CommentResponse]
+    like_count: int = 0
+    liked_by_me: bool = False
+
+    @computed_field
+    @property
+    def post_image_variants(self) -> Optional[Dict[str, str]]:
+        return image_variants(self.post_image)
 
     class Config:
         from_attributes = True
 
+
+class PostResponse(PostBase):
+    owner: Profile
+    comments: List[CommentResponse]
+
+
+class NormalizedPost(PostBase):
+    references: ClassVar[Dict[str, str]] = {"owner_id": "owner"}
+
+    owner_id: int
+    comments: List[NormalizedComment]
+
     
 class CreateEvent(BaseModel):
     title: str
     description: str
-    event_date: str
+    event_date: datetime
     image: Optional[str] = Field(None)
     location: str
 
+    @field_validator("event_date")
+    @classmethod
+    def event_date_utc(cls, value: datetime) -> datetime:
+        # Dates without an offset are taken as UTC.
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+
     class Config:
         from_attributes = True
 
@@ -91,10 +142,23 @@ class CreateEvent(BaseModel):
 class EventResponse(CreateEvent):
     id: int
 
+    @computed_field
+    @property
+    def image_variants(self) -> Optional[Dict[str, str]]:
+        return image_variants(self.image)
+
     class Config:
         from_attributes = True
 
 
+class EventCalendar(BaseModel):
+    # Number of events starting on each day of the month (UTC), days without
+    # events left out.
+    year: int
+    month: int
+    days: Dict[int, int]
+
+
 class CreateAnnouncement(BaseModel):
     content: str
 
@@ -102,17 +166,26 @@ class CreateAnnouncement(BaseModel):
         from_attributes = True
 
 
-class AnnouncementResponse(BaseModel):
+class AnnouncementBase(BaseModel):
     id: int
     content: str
     created_at: datetime
     updated_at: datetime
-    owner: Profile
 
     class Config:
         from_attributes = True
 
 
+class AnnouncementResponse(AnnouncementBase):
+    owner: Profile
+
+
+class NormalizedAnnouncement(AnnouncementBase):
+    references: ClassVar[Dict[str, str]] = {"owner_id": "owner"}
+
+    owner_id: int
+
+
 class CreateCommunity(BaseModel):
     name: str
     description: str
@@ -121,17 +194,79 @@ class CreateCommunity(BaseModel):
         from_attributes = True
 
 
-class CommunityResponse(BaseModel):
+class PostPreview(BaseModel):
+    id: int
+    content: str
+    post_image: Optional[str] = Field(None)
+    created_at: datetime
+    owner_id: int
+
+    @computed_field
+    @property
+    def post_image_variants(self) -> Optional[Dict[str, str]]:
+        return image_variants(self.post_image)
+
+    class Config:
+        from_attributes = True
+
+
+class CommunitySummary(BaseModel):
     id: int
     name: str
     description: str
-    posts: List[PostResponse]
     owner: Profile
+    member_count: int
+    post_count: int
+    last_activity_at: datetime
+    latest_posts: List[PostPreview]
+
+    class Config:
+        from_attributes = True
+
+
+class NormalizedCommunitySummary(BaseModel):
+    references: ClassVar[Dict[str, str]] = {"owner_id": "owner"}
+
+    id: int
+    name: str
+    description: str
+    owner_id: int
+    member_count: int
+    post_count: int
+    last_activity_at: datetime
+    latest_posts: List[PostPreview]
 
     class Config:
         from_attributes = True
 
 
+Item = TypeVar("Item")
+
+
+class NormalizedPage(BaseModel, Generic[Item]):
+    # ?shape=normalized listings: items reference users by id and each user
+    # appears once in `users`, keyed by id.
+    data: List[Item]
+    users: Dict[int, Profile]
+
+
+class SyncPage(BaseModel, Generic[Item]):
+    # Rows created or updated since the token, ids deleted since it, and the
+    # token for the next poll. has_more means poll again right away.
+    changes: List[Item]
+    deleted: List[int]
+    since: str
+    has_more: bool
+
+
+NORMALIZED_SCHEMAS = {
+    CommentResponse: NormalizedComment,
+    PostResponse: NormalizedPost,
+    AnnouncementResponse: NormalizedAnnouncement,
+    CommunitySummary: NormalizedCommunitySummary,
+}
+
+
 class Vote(BaseModel):
     post_id: int
     dir: conint(le=1)
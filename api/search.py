@@ -0,0 +1,195 @@
+import heapq
+import threading
+from collections import Counter, defaultdict
+from sqlalchemy import Float, String, case, event, func, literal_column, or_, select, tuple_, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models.user import Community, User
+from utils.pagination import decode_cursor, encode_cursor
+
+
+SEARCH_RANKED = "ranked"
+SEARCH_PREFIX = "prefix"
+
+# Same default as pg_trgm's pg_trgm.similarity_threshold.
+SIMILARITY_THRESHOLD = 0.3
+
+SCORE = literal_column("score", Float)
+
+
+def trigrams(value: str) -> set:
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def match_bonus(value: str, q: str) -> float:
+    if value == q:
+        return 3.0
+    if value.startswith(q):
+        return 2.0
+    if q in value:
+        return 1.0
+    return 0.0
+
+
+class NgramIndex:
+    # In-process trigram index used for ranked search when pg_trgm is not
+    # available, i.e. SQLite in development. Scores mirror the SQL ranking.
+
+    def __init__(self):
+        self.values = {}
+        self.sizes = {}
+        self.postings = defaultdict(set)
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def add(self, id: int, value):
+        with self.lock:
+            self._remove(id)
+            if value:
+                value = value.lower()
+                grams = trigrams(value)
+                self.values[id] = value
+                self.sizes[id] = len(grams)
+                for gram in grams:
+                    self.postings[gram].add(id)
+
+    def remove(self, id: int):
+        with self.lock:
+            self._remove(id)
+
+    def _remove(self, id: int):
+        value = self.values.pop(id, None)
+        if value is not None:
+            del self.sizes[id]
+            for gram in trigrams(value):
+                self.postings[gram].discard(id)
+
+    def similarities(self, q: str) -> dict:
+        # Trigram similarity for every row sharing at least one trigram with
+        # q, computed from posting list overlaps without rescanning values.
+        q_grams = trigrams(q)
+        with self.lock:
+            overlaps = Counter()
+            for gram in q_grams:
+                overlaps.update(self.postings.get(gram, ()))
+            similarities = {
+                id: overlap / (self.sizes[id] + len(q_grams) - overlap)
+                for id, overlap in overlaps.items()
+            }
+            if len(q) < 3:
+                # Short queries have no inner trigram, so substring matches
+                # are not guaranteed to share one with the value.
+                for id, value in self.values.items():
+                    if q in value:
+                        similarities.setdefault(id, 0.0)
+            return similarities
+
+
+class SearchTarget:
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.indexes = {column.key: NgramIndex() for column, _ in fields}
+
+        event.listen(model, "after_insert", self.index_row)
+        event.listen(model, "after_update", self.index_row)
+        event.listen(model, "after_delete", self.unindex_row)
+
+    def index_row(self, mapper, connection, target):
+        for column, _ in self.fields:
+            index = self.indexes[column.key]
+            if index.loaded:
+                index.add(target.id, getattr(target, column.key))
+
+    def unindex_row(self, mapper, connection, target):
+        for index in self.indexes.values():
+            index.remove(target.id)
+
+    async def load(self, db: AsyncSession):
+        for column, _ in self.fields:
+            index = self.indexes[column.key]
+            if not index.loaded:
+                for id, value in await db.execute(select(self.model.id, column)):
+                    index.add(id, value)
+                index.loaded = True
+
+    def ranked(self, q: str, limit: int, after=None):
+        similarities = {key: index.similarities(q) for key, index in self.indexes.items()}
+        candidates = set()
+        for column_similarities in similarities.values():
+            candidates.update(column_similarities)
+
+        results = []
+        for id in candidates:
+            score, matched = 0.0, False
+            for column, weight in self.fields:
+                value = self.indexes[column.key].values.get(id)
+                if value is None:
+                    continue
+                value_similarity = similarities[column.key].get(id, 0.0)
+                score += weight * (match_bonus(value, q) + value_similarity)
+                matched = matched or value_similarity >= SIMILARITY_THRESHOLD or q in value
+            if matched and (after is None or (score, id) < tuple(after)):
+                results.append((score, id))
+
+        return heapq.nlargest(limit, results)
+
+
+user_search = SearchTarget(User, ((User.username, 1.0),))
+community_search = SearchTarget(Community, ((Community.name, 1.0), (Community.description, 0.5)))
+
+
+def sql_score(column, q: str):
+    lowered = func.lower(column)
+    bonus = case(
+        (lowered == q, 3.0),
+        (lowered.startswith(q, autoescape=True), 2.0),
+        (lowered.contains(q, autoescape=True), 1.0),
+        else_=0.0,
+    )
+    return bonus + func.coalesce(func.similarity(lowered, q, type_=Float), 0.0)
+
+
+def sql_match(column, q: str):
+    lowered = func.lower(column)
+    return or_(lowered.contains(q, autoescape=True), lowered.op("%")(q))
+
+
+async def ranked_search(db: AsyncSession, target: SearchTarget, q: str, limit: int, cursor=None):
+    after = decode_cursor(cursor, (SCORE, target.model.id)) if cursor else None
+
+    if db.bind.dialect.name != "postgresql":
+        await target.load(db)
+        return target.ranked(q, limit, after)
+
+    score = type_coerce(sum(weight * sql_score(column, q) for column, weight in target.fields), Float)
+    query = select(score, target.model.id).where(or_(*[sql_match(column, q) for column, _ in target.fields]))
+    if after:
+        query = query.where(tuple_(score, target.model.id) < tuple_(*after))
+    query = query.order_by(score.desc(), target.model.id.desc()).limit(limit)
+    return (await db.execute(query)).all()
+
+
+async def prefix_search(db: AsyncSession, target: SearchTarget, q: str, limit: int, cursor=None):
+    # A range scan over the byte-ordered lower(column) index, which both
+    # dialects can answer without touching rows outside the prefix.
+    key = func.lower(target.fields[0][0], type_=String)
+    if db.bind.dialect.name == "postgresql":
+        key = key.collate("C")
+
+    query = select(key, target.model.id).where(key >= q, key < q[:-1] + chr(ord(q[-1]) + 1))
+    if cursor:
+        query = query.where(tuple_(key, target.model.id) > tuple_(*decode_cursor(cursor, (key, target.model.id))))
+    query = query.order_by(key, target.model.id).limit(limit)
+    return (await db.execute(query)).all()
+
+
+async def search(db: AsyncSession, target: SearchTarget, q: str, mode: str, limit: int, cursor=None):
+    q = q.lower()
+    if mode == SEARCH_PREFIX:
+        rows = await prefix_search(db, target, q, limit, cursor)
+    else:
+        rows = await ranked_search(db, target, q, limit, cursor)
+
+    next_cursor = encode_cursor(rows[-1]) if len(rows) == limit else None
+    return [id for _, id in rows], next_cursor
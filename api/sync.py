@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
+from sqlalchemy import delete, event, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.models.user import Announcement, Event, Post, Tombstone
+from config.config import settings
+from database.db import AsyncSessionLocal
+from utils.pagination import decode_cursor, encode_cursor
+
+
+# Delta sync for polling clients. A sync token is the (updated_at, id) of the
+# last change and the (deleted_at, resource_id) of the last tombstone a client
+# has seen; a poll returns rows past both, oldest first, and the new token.
+# With nothing new that is one probe of each (updated_at, id) and
+# (resource, deleted_at, resource_id) index.
+#
+# Rows written in the last SYNC_SETTLE_SECONDS are held back until the next
+# poll: timestamps are taken before commit, so a slow transaction can commit
+# a row older than one already handed out, which a watermark would skip.
+
+logger = logging.getLogger(__name__)
+
+
+def local_time(value: datetime) -> datetime:
+    # Timestamps are written as naive local times (datetime.now()), like
+    # created_at; Postgres hands them back with an offset.
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+
+class SyncFeed:
+    def __init__(self, model, resource: str):
+        self.model = model
+        self.resource = resource
+        self.key = (model.updated_at, model.id)
+        self.token_columns = self.key + (Tombstone.deleted_at, Tombstone.resource_id)
+
+        event.listen(model, "after_delete", self.record_deletion)
+
+    def record_deletion(self, mapper, connection, target):
+        # Same transaction as the delete. Rows removed by ON DELETE CASCADE
+        # or bulk deletes bypass this and aren't reported.
+        connection.execute(insert(Tombstone).values(resource=self.resource, resource_id=target.id, deleted_at=datetime.now()))
+
+    def changes_query(self, updated_at: datetime, id: int, settled: datetime, limit: int):
+        # One row past `limit` tells whether there is more.
+        return (
+            select(self.model)
+            .where(self.model.updated_at <= settled, tuple_(*self.key) > tuple_(updated_at, id))
+            .order_by(*self.key)
+            .limit(limit + 1)
+        )
+
+    def tombstones_query(self, deleted_at: datetime, deleted_id: int, settled: datetime, limit: int):
+        return (
+            select(Tombstone.deleted_at, Tombstone.resource_id)
+            .where(
+                Tombstone.resource == self.resource,
+                Tombstone.deleted_at <= settled,
+                tuple_(Tombstone.deleted_at, Tombstone.resource_id) > tuple_(deleted_at, deleted_id),
+            )
+            .order_by(Tombstone.deleted_at, Tombstone.resource_id)
+            .limit(limit + 1)
+        )
+
+    async def changes(self, db: AsyncSession, since: str = None, limit: int = 100, options=()):
+        settled = datetime.now() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+        if since:
+            updated_at, id, deleted_at, deleted_id = decode_cursor(since, self.token_columns)
+            updated_at, deleted_at = local_time(updated_at), local_time(deleted_at)
+            if deleted_at < datetime.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS):
+                raise HTTPException(status_code=status.HTTP_410_GONE, detail="Sync token expired, sync again without since")
+        else:
+            # A first sync starts from the oldest row; deletions before it
+            # are already reflected in what it returns.
+            updated_at, id = datetime(1970, 1, 1), 0
+            deleted_at, deleted_id = settled, 0
+
+        rows = (await db.scalars(self.changes_query(updated_at, id, settled, limit).options(*options))).all()
+        tombstones = (await db.execute(self.tombstones_query(deleted_at, deleted_id, settled, limit))).all()
+
+        has_more = len(rows) > limit or len(tombstones) > limit
+        rows, tombstones = rows[:limit], tombstones[:limit]
+        if rows:
+            updated_at, id = rows[-1].updated_at, rows[-1].id
+        if tombstones:
+            deleted_at, deleted_id = tombstones[-1]
+        elif deleted_at < settled:
+            # Every tombstone up to `settled` has been handed out; moving up
+            # keeps an idle client's token from expiring.
+            deleted_at, deleted_id = settled, 0
+
+        return {
+            "changes": rows,
+            "deleted": [resource_id for _, resource_id in tombstones],
+            "since": encode_cursor([updated_at, id, deleted_at, deleted_id]),
+            "has_more": has_more,
+        }
+
+
+post_sync = SyncFeed(Post, "post")
+event_sync = SyncFeed(Event, "event")
+announcement_sync = SyncFeed(Announcement, "announcement")
+
+
+async def touch_post(db: AsyncSession, post_id: int):
+    # Post payloads embed their comments, so a new comment is a change of
+    # the post for sync clients.
+    await db.execute(
+        update(Post).where(Post.id == post_id).values(updated_at=datetime.now()).execution_options(synchronize_session=False)
+    )
+
+
+async def prune_tombstones() -> int:
+    cutoff = datetime.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(delete(Tombstone).where(Tombstone.deleted_at < cutoff))
+        await db.commit()
+    return result.rowcount
+
+
+async def run_tombstone_pruner():
+    while True:
+        await asyncio.sleep(timedelta(days=1).total_seconds())
+        try:
+            await prune_tombstones()
+        except Exception:
+            logger.exception("Failed to prune tombstones")
@@ -0,0 +1,101 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from api.loaders import comment_response_options
+from api.models.user import Comment, User
+from config.config import settings
+from utils.pagination import encode_cursor, keyset_paginate
+
+
+THREAD_PAGE_KEY = (Comment.created_at, Comment.id)
+
+
+def thread_query(criteria, limit: int, cursor, depth: int, replies: int):
+    # One recursive query: a page of root comments matching `criteria`, then
+    # for every loaded comment its first `replies` children, down to `depth`
+    # levels. Children are picked through the (reply_to_comment_id,
+    # created_at, id) index, so a comment with thousands of replies costs a
+    # few index probes per loaded child. The CTE is walked breadth first and
+    # cut at THREAD_MAX_NODES, which bounds the work for any tree shape.
+    roots = keyset_paginate(select(Comment.id).where(*criteria), THREAD_PAGE_KEY, cursor, limit=limit, descending=False).subquery()
+    tree = select(roots.c.id, literal(0).label("depth")).cte("thread", recursive=True)
+
+    child, sibling = aliased(Comment), aliased(Comment)
+    first_replies = (
+        select(sibling.id)
+        .where(sibling.reply_to_comment_id == child.reply_to_comment_id)
+        .order_by(sibling.created_at, sibling.id)
+        .limit(replies)
+        .correlate(child)
+    )
+    tree = tree.union_all(
+        select(child.id, (tree.c.depth + 1).label("depth"))
+        .join(tree, child.reply_to_comment_id == tree.c.id)
+        .where(tree.c.depth < depth, child.id.in_(first_replies))
+    )
+    nodes = select(tree.c.id, tree.c.depth).limit(settings.THREAD_MAX_NODES).subquery()
+
+    reply = aliased(Comment)
+    reply_count = select(func.count()).where(reply.reply_to_comment_id == Comment.id).correlate(Comment).scalar_subquery()
+    return (
+        select(Comment, nodes.c.depth, reply_count.label("reply_count"))
+        .join(nodes, nodes.c.id == Comment.id)
+        .options(*comment_response_options())
+    )
+
+
+async def insert_comment(db: AsyncSession, user: User, content: str, criteria, **columns) -> Optional[Comment]:
+    # One INSERT ... SELECT ... RETURNING: `columns` are read from the parent
+    # row matching `criteria`, so a missing parent inserts nothing and returns
+    # None instead of needing a lookup first.
+    values = {
+        "content": literal(content, Comment.content.type),
+        "created_at": literal(datetime.now(), Comment.created_at.type),
+        "user_id": literal(user.id, Comment.user_id.type),
+        **columns,
+    }
+    comment = await db.scalar(
+        insert(Comment).from_select(list(values), select(*values.values()).where(*criteria)).returning(Comment)
+    )
+    if comment is not None:
+        set_committed_value(comment, "user", user)
+    return comment
+
+
+async def comment_thread(db: AsyncSession, criteria, limit: int, cursor=None, depth: int = 3, replies: int = 3):
+    rows = (await db.execute(thread_query(criteria, limit, cursor, depth, replies if depth else 0))).all()
+    rows.sort(key=lambda row: (row.depth, row.Comment.created_at, row.Comment.id))
+
+    nodes, roots = {}, []
+    for comment, level, reply_count in rows:
+        node = {
+            "id": comment.id,
+            "content": comment.content,
+            "created_at": comment.created_at,
+            "event_id": comment.event_id,
+            "post_id": comment.post_id,
+            "user": comment.user,
+            "reply_to_comment_id": comment.reply_to_comment_id,
+            "reply_count": reply_count,
+            "replies": [],
+        }
+        if level == 0:
+            roots.append(node)
+        elif comment.reply_to_comment_id in nodes:
+            nodes[comment.reply_to_comment_id]["replies"].append(node)
+        else:
+            continue
+        nodes[comment.id] = node
+
+    for node in nodes.values():
+        loaded = node["replies"]
+        node["has_more_replies"] = node["reply_count"] > len(loaded)
+        node["replies_cursor"] = (
+            encode_cursor((loaded[-1]["created_at"], loaded[-1]["id"])) if loaded and node["has_more_replies"] else None
+        )
+
+    next_cursor = encode_cursor((roots[-1]["created_at"], roots[-1]["id"])) if len(roots) == limit else None
+    return roots, next_cursor
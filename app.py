@@ -1,12 +1,29 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import secrets
+from fastapi import Depends, FastAPI, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from database.db import Base, engine
+from fastapi.staticfiles import StaticFiles
+from config.config import settings
 from api.routes.user import user_router
 from api.routes.auth import auth_router
 from api.routes.post import post_router
 from api.routes.event import event_router
 from api.routes.announcements import announcement_router
 from api.routes.communities import community_router
+from api.routes.uploads import upload_router
+from api.routes.feed import feed_router
+from api.routes.comments import comment_router
+from api.likes import flush_like_counts, run_like_jobs
+from api.community_stats import run_community_stats_verifier
+from api.sync import run_tombstone_pruner
+from utils.cache import cache_stats
+from utils.http_cache import response_cache
+from utils.metrics import MetricsMiddleware, render_metrics
+from utils.pagination import NEXT_CURSOR_HEADER
+from utils.permissions import is_admin
+from utils.utils import shutdown_password_pool
 
 
 app = FastAPI()
@@ -17,18 +34,53 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
+app.add_middleware(MetricsMiddleware)
 
 
-Base.metadata.create_all(bind=engine)
-
 app.include_router(user_router)
 app.include_router(auth_router)
 app.include_router(post_router)
 app.include_router(event_router)
 app.include_router(announcement_router)
 app.include_router(community_router)
+app.include_router(upload_router)
+app.include_router(feed_router)
+app.include_router(comment_router)
+
+if settings.STORAGE_BACKEND == "local":
+    os.makedirs(settings.LOCAL_STORAGE_ROOT, exist_ok=True)
+    app.mount(settings.LOCAL_STORAGE_URL, StaticFiles(directory=settings.LOCAL_STORAGE_ROOT), name="media")
+
+@app.on_event("startup")
+async def startup():
+    app.state.like_jobs = asyncio.create_task(run_like_jobs())
+    app.state.community_stats_verifier = asyncio.create_task(run_community_stats_verifier())
+    app.state.tombstone_pruner = asyncio.create_task(run_tombstone_pruner())
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.like_jobs.cancel()
+    app.state.community_stats_verifier.cancel()
+    app.state.tombstone_pruner.cancel()
+    await flush_like_counts()
+    shutdown_password_pool()
 
 @app.get("/")
 def root():
-    return {"message": "Hello World"}
\ No newline at end of file
+    return {"message": "Hello World"}
+
+@app.get("/cache/stats", dependencies=[Depends(is_admin)])
+def get_cache_stats():
+    return {**cache_stats(), "http": response_cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics(authorization: str = Header(None)):
+    # Off unless METRICS_TOKEN is set: latencies, slow queries and pool
+    # state are for the scraper, not the public.
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not secrets.compare_digest(authorization or "", f"Bearer {settings.METRICS_TOKEN}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    return render_metrics()
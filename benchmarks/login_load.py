@@ -0,0 +1,64 @@
+"""Login bursts against read traffic on a running server.
+
+    python -m benchmarks.login_load --base-url http://localhost:8000 \
+        --email user@example.com --password secret --logins 20 --readers 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import defaultdict
+import httpx
+from benchmarks.report import percentile
+
+
+READ_ROUTES = ["/posts/", "/announcements/", "/events/", "/communities/"]
+
+
+async def login_worker(client, args, results, deadline):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.post("/login", data={"username": args.email, "password": args.password})
+        results["/login"].append((time.perf_counter() - started, response.status_code))
+
+
+async def read_worker(client, results, deadline, offset):
+    index = offset
+    while time.perf_counter() < deadline:
+        route = READ_ROUTES[index % len(READ_ROUTES)]
+        index += 1
+        started = time.perf_counter()
+        response = await client.get(route)
+        results[route].append((time.perf_counter() - started, response.status_code))
+
+
+def report(results, duration):
+    print(f"{'route':16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'503s':>6}")
+    for route, samples in sorted(results.items()):
+        latencies = [latency * 1000 for latency, _ in samples]
+        rejected = sum(1 for _, code in samples if code == 503)
+        print(f"{route:16} {len(samples) / duration:8.1f} {statistics.median(latencies):8.1f} "
+              f"{percentile(latencies, 0.95):8.1f} {rejected:6}")
+
+
+async def main(args):
+    results = defaultdict(list)
+    limits = httpx.Limits(max_connections=args.logins + args.readers)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *[login_worker(client, args, results, deadline) for _ in range(args.logins)],
+            *[read_worker(client, results, deadline, offset) for offset in range(args.readers)],
+        )
+    report(results, args.duration)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--readers", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""Throughput and latency percentiles per route, saved as JSON and diffed.
+
+    python -m benchmarks.report results.json --baseline baseline.json
+
+benchmarks.scenarios prints the same report after a run and saves it with
+--save; pass a saved run as --baseline to see the change of every route.
+"""
+import argparse
+import json
+import platform
+from datetime import datetime
+
+
+PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(samples, duration: float, meta: dict = None) -> dict:
+    # samples: (route, seconds, status) per request. Rejected requests are
+    # usually fast, so rps and the percentiles only cover 2xx responses;
+    # 4xx and 5xx are counted on their own.
+    by_route = {}
+    for route, seconds, status in samples:
+        by_route.setdefault(route, []).append((seconds * 1000, status))
+
+    routes = {}
+    for route, results in sorted(by_route.items()):
+        latencies = sorted(latency for latency, status in results if 200 <= status < 300)
+        routes[route] = {
+            "requests": len(results),
+            "rps": len(latencies) / duration,
+            **{name: percentile(latencies, fraction) for name, fraction in PERCENTILES},
+            "4xx": sum(1 for _, status in results if 400 <= status < 500),
+            "5xx": sum(1 for _, status in results if status >= 500),
+        }
+    return {
+        "meta": {"finished_at": datetime.now().isoformat(), "python": platform.python_version(), **(meta or {})},
+        "duration": duration,
+        "routes": routes,
+    }
+
+
+def save(summary: dict, path: str):
+    with open(path, "w") as output:
+        json.dump(summary, output, indent=2, sort_keys=True)
+
+
+def load(path: str) -> dict:
+    with open(path) as source:
+        return json.load(source)
+
+
+def change(current, previous) -> str:
+    if not previous or current is None:
+        return ""
+    return f"{(current - previous) / previous * 100:+.0f}%"
+
+
+def print_report(summary: dict, baseline: dict = None):
+    columns = ("rps",) + tuple(name for name, _ in PERCENTILES)
+    header = f"{'route':44} {'requests':>8} " + " ".join(f"{name + (' ms' if name != 'rps' else ''):>9}" for name in columns) + f" {'4xx':>5} {'5xx':>5}"
+    if baseline:
+        header += "  " + " ".join(f"{'Δ' + name:>6}" for name in columns)
+    print(header)
+
+    previous_routes = baseline["routes"] if baseline else {}
+    for route, stats in summary["routes"].items():
+        line = f"{route:44} {stats['requests']:8} " + " ".join(f"{stats[name]:9.1f}" if stats[name] is not None else f"{'-':>9}" for name in columns)
+        line += f" {stats['4xx']:5} {stats['5xx']:5}"
+        previous = previous_routes.get(route)
+        if previous:
+            line += "  " + " ".join(f"{change(stats[name], previous.get(name)):>6}" for name in columns)
+        print(line)
+    for route in previous_routes.keys() - summary["routes"].keys():
+        print(f"{route:44} missing from this run")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("results")
+    parser.add_argument("--baseline")
+    args = parser.parse_args()
+    print_report(load(args.results), load(args.baseline) if args.baseline else None)
@@ -0,0 +1,199 @@
+"""Drive the API with a weighted mix of requests and report each route.
+
+    python -m benchmarks.seed --scale 100000
+    python -m benchmarks.scenarios browse --scale 100000 --concurrency 20 --duration 30 --save run.json
+    python -m benchmarks.scenarios comments --base-url http://localhost:8000 --baseline run.json
+
+Without --base-url the routers run in-process through httpx's ASGI
+transport, which leaves out the network and uvicorn; with it, requests go to
+a running server. Ids and logins come from benchmarks.seed's plan for
+--scale, so both must use the same scale against the same database. Every
+worker logs in as a seeded user before the timed run.
+"""
+import argparse
+import asyncio
+import random
+import time
+import httpx
+from benchmarks.report import load, print_report, save, summarize
+from benchmarks.seed import SEED_DOMAIN, SEED_PASSWORD, plan, skewed
+
+
+class Worker:
+    def __init__(self, client, counts, rng):
+        self.client = client
+        self.counts = counts
+        self.rng = rng
+        self.headers = {}
+        # Posts this user likes, so `like` unlikes them next time instead
+        # of timing a 400, and those this worker's likes added.
+        self.liked = set()
+        self.added = set()
+
+    def pick(self, name: str) -> int:
+        return skewed(self.rng, self.counts[name])
+
+    def credentials(self) -> dict:
+        return {"username": f"user{self.rng.randint(1, self.counts['users'])}{SEED_DOMAIN}", "password": SEED_PASSWORD}
+
+    async def log_in(self) -> bool:
+        credentials = self.credentials()
+        response = await self.client.post("/login", data=credentials)
+        if response.status_code != 200:
+            print(f"Logging in as {credentials['username']} failed with {response.status_code}")
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return True
+
+    async def unlike_added(self):
+        # Leaves the likes as the seed wrote them for the next run.
+        for post_id in self.added:
+            await self.client.delete(f"/posts/{post_id}/like", headers=self.headers)
+
+
+# Each operation sends one request and returns it with the route template it
+# is reported under.
+
+async def list_posts(worker):
+    return "GET /posts/", await worker.client.get("/posts/", headers=worker.headers)
+
+
+async def get_post(worker):
+    return "GET /posts/{post_id}/", await worker.client.get(f"/posts/{worker.pick('posts')}/", headers=worker.headers)
+
+
+async def get_community(worker):
+    return "GET /communities/{community_id}", await worker.client.get(f"/communities/{worker.pick('communities')}")
+
+
+async def community_posts(worker):
+    return "GET /communities/{community_id}/posts", await worker.client.get(f"/communities/{worker.pick('communities')}/posts", headers=worker.headers)
+
+
+async def upcoming_events(worker):
+    return "GET /events/", await worker.client.get("/events/", params={"upcoming": "true"})
+
+
+async def announcements(worker):
+    return "GET /announcements/", await worker.client.get("/announcements/")
+
+
+async def post_comments(worker):
+    return "GET /posts/{post_id}/comments", await worker.client.get(f"/posts/{worker.pick('posts')}/comments")
+
+
+async def post_thread(worker):
+    return "GET /posts/{post_id}/comments/thread", await worker.client.get(f"/posts/{worker.pick('posts')}/comments/thread")
+
+
+async def replies(worker):
+    return "GET /comments/{comment_id}/replies", await worker.client.get(f"/comments/{worker.pick('comments')}/replies")
+
+
+async def comment(worker):
+    return "POST /posts/{post_id}/comments", await worker.client.post(
+        f"/posts/{worker.pick('posts')}/comments", json={"content": "benchmark comment"}, headers=worker.headers)
+
+
+async def reply(worker):
+    return "POST /comments/{comment_id}/replies", await worker.client.post(
+        f"/comments/{worker.pick('comments')}/replies", json={"content": "benchmark reply"}, headers=worker.headers)
+
+
+async def like(worker):
+    post_id = worker.pick("posts")
+    if post_id in worker.liked:
+        worker.liked.discard(post_id)
+        worker.added.discard(post_id)
+        return "DELETE /posts/{post_id}/like", await worker.client.delete(f"/posts/{post_id}/like", headers=worker.headers)
+
+    response = await worker.client.post(f"/posts/{post_id}/like", headers=worker.headers)
+    # Liked afterwards either way: a 400 means the seed already liked it.
+    worker.liked.add(post_id)
+    if response.status_code == 202:
+        worker.added.add(post_id)
+    return "POST /posts/{post_id}/like", response
+
+
+async def feed(worker):
+    return "GET /feed/", await worker.client.get("/feed/", headers=worker.headers)
+
+
+async def login(worker):
+    return "POST /login", await worker.client.post("/login", data=worker.credentials())
+
+
+SCENARIOS = {
+    "browse": ((4, list_posts), (3, get_post), (2, get_community), (2, community_posts), (1, upcoming_events), (1, announcements)),
+    "comments": ((2, post_comments), (3, post_thread), (2, replies), (1, comment), (1, reply)),
+    "social": ((4, feed), (2, get_post), (2, like), (1, community_posts)),
+    "login": ((1, login),),
+}
+SCENARIOS["mixed"] = tuple(operation for operations in SCENARIOS.values() for operation in operations)
+
+
+async def run(worker, operations, deadline, samples):
+    weights = [weight for weight, _ in operations]
+    functions = [function for _, function in operations]
+    while time.perf_counter() < deadline:
+        operation = worker.rng.choices(functions, weights)[0]
+        started = time.perf_counter()
+        try:
+            route, response = await operation(worker)
+            status = response.status_code
+        except httpx.HTTPError:
+            route, status = operation.__name__, 599
+        if samples is not None:
+            samples.append((route, time.perf_counter() - started, status))
+
+
+def make_client(args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    if args.base_url:
+        return httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30)
+
+    from app import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=30)
+
+
+async def main(args):
+    counts = plan(args.scale)
+    operations = SCENARIOS[args.scenario]
+    async with make_client(args) as client:
+        workers = [Worker(client, counts, random.Random(f"{args.seed}:{i}")) for i in range(args.concurrency)]
+        # Without a token every authenticated operation would time a 401.
+        if not all(await asyncio.gather(*[worker.log_in() for worker in workers])):
+            raise SystemExit("Workers failed to log in; was benchmarks.seed run with the same --scale?")
+
+        if args.warmup:
+            deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(*[run(worker, operations, deadline, None) for worker in workers])
+
+        samples = []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*[run(worker, operations, deadline, samples) for worker in workers])
+        duration = time.perf_counter() - started
+        await asyncio.gather(*[worker.unlike_added() for worker in workers])
+
+    summary = summarize(samples, duration, {
+        "scenario": args.scenario, "concurrency": args.concurrency, "scale": args.scale,
+        "seed": args.seed, "target": args.base_url or "in-process",
+    })
+    print_report(summary, load(args.baseline) if args.baseline else None)
+    if args.save:
+        save(summary, args.save)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--base-url", help="a running server; the app runs in-process without it")
+    parser.add_argument("--scale", type=int, default=10000, help="the --scale benchmarks.seed was run with")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--save", help="write the results as JSON to this path")
+    parser.add_argument("--baseline", help="a saved run to compare against")
+    asyncio.run(main(parser.parse_args()))
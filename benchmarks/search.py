@@ -0,0 +1,90 @@
+"""Seed users and compare the legacy contains filter with indexed search.
+
+    python -m benchmarks.search --users 100000 --queries 200
+
+Runs against the configured database; seeded rows use ``@bench.local``
+emails and are left in place so repeated runs skip seeding.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import string
+import time
+from sqlalchemy import func, insert, select
+from api.models.user import User
+from api.search import SEARCH_PREFIX, SEARCH_RANKED, search, user_search
+from database.db import AsyncSessionLocal
+
+
+SEED_DOMAIN = "@bench.local"
+BATCH_SIZE = 5000
+
+
+def random_username(rng):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 12)))
+
+
+async def seed(db, count, rng):
+    existing = await db.scalar(select(func.count()).select_from(User).where(User.email.endswith(SEED_DOMAIN)))
+    for start in range(existing, count, BATCH_SIZE):
+        rows = []
+        for i in range(start, min(count, start + BATCH_SIZE)):
+            username = f"{random_username(rng)}_{i}"
+            rows.append({
+                "username": username,
+                "email": username + SEED_DOMAIN,
+                "password": "x",
+                "name": username,
+            })
+        await db.execute(insert(User), rows)
+        await db.commit()
+
+
+async def legacy(db, q, limit):
+    return (await db.scalars(select(User.id).where(func.lower(User.username).contains(func.lower(q))))).all()
+
+
+def indexed(mode):
+    async def run(db, q, limit):
+        return await search(db, user_search, q, mode, limit)
+    return run
+
+
+async def measure(db, runner, queries, limit):
+    latencies = []
+    for q in queries:
+        started = time.perf_counter()
+        await runner(db, q, limit)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    async with AsyncSessionLocal() as db:
+        await seed(db, args.users, rng)
+        queries = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 4)))
+                   for _ in range(args.queries)]
+
+        # Warm the in-process index outside the timed runs on SQLite.
+        await search(db, user_search, queries[0], SEARCH_RANKED, args.limit)
+
+        print(f"{'mode':10} {'p50 ms':>8} {'p95 ms':>8}")
+        for name, runner in (
+            ("legacy", legacy),
+            (SEARCH_PREFIX, indexed(SEARCH_PREFIX)),
+            (SEARCH_RANKED, indexed(SEARCH_RANKED)),
+        ):
+            p50, p95 = await measure(db, runner, queries, args.limit)
+            print(f"{name:10} {p50:8.2f} {p95:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
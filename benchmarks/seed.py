@@ -0,0 +1,240 @@
+"""Fill an empty database with a reproducible synthetic community.
+
+    python -m benchmarks.seed --scale 100000 --seed 1
+    python -m benchmarks.seed --scale 10000 --create-schema   # fresh SQLite file
+
+Writes about --scale rows, split over users, communities, memberships, posts,
+comments, likes, events and announcements (see RATIOS), into the configured
+database. The same scale and seed always produce the same rows, so
+benchmarks.scenarios can pick valid ids and log in as user{n}@seed.example.com
+with SEED_PASSWORD without reading them back. Postgres databases are expected
+at `alembic upgrade head`; --create-schema builds the tables from the models
+instead, for a scratch SQLite file.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, text
+from api.community_stats import verify_community_stats
+from api.likes import reconcile_like_counts
+from api.models.user import Announcement, Comment, Community, CommunityMembership, Event, Like, Post, User
+from config.config import settings
+from database.db import AsyncSessionLocal, Base, async_engine
+from utils.utils import hash_password
+
+
+SEED_DOMAIN = "@seed.example.com"
+SEED_PASSWORD = "benchmark"
+BATCH_SIZE = 5000
+EPOCH = datetime(2024, 1, 1)
+SPAN = timedelta(days=365)
+
+RATIOS = {
+    "users": 0.05,
+    "communities": 0.001,
+    "memberships": 0.1,
+    "posts": 0.2,
+    "comments": 0.4,
+    "likes": 0.2,
+    "events": 0.02,
+    "announcements": 0.02,
+}
+
+WORDS = ("study", "exam", "notes", "group", "lecture", "project", "deadline", "campus", "library",
+         "question", "answer", "thanks", "anyone", "help", "today", "tomorrow", "week", "class")
+
+
+def plan(scale: int) -> dict:
+    return {name: max(1, int(scale * ratio)) for name, ratio in RATIOS.items()}
+
+
+def skewed(rng, n: int) -> int:
+    # 1..n with a long tail: low ids are picked far more often, so a few
+    # communities and posts get most of the members, likes and comments.
+    return min(n, int(n * rng.random() ** 3) + 1)
+
+
+def sentence(rng, low=4, high=30) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+def spread(i: int, count: int, span=SPAN) -> datetime:
+    return EPOCH + span * (i / count)
+
+
+class BatchWriter:
+    def __init__(self, db):
+        self.db = db
+        self.rows = {}
+        self.written = {}
+
+    async def add(self, model, row):
+        rows = self.rows.setdefault(model, [])
+        rows.append(row)
+        if len(rows) >= BATCH_SIZE:
+            await self.flush(model)
+
+    async def flush(self, model=None):
+        for pending in [model] if model is not None else list(self.rows):
+            rows = self.rows.pop(pending, None)
+            if rows:
+                await self.db.execute(insert(pending), rows)
+                await self.db.commit()
+                self.written[pending.__tablename__] = self.written.get(pending.__tablename__, 0) + len(rows)
+
+
+async def seed_users(writer, counts, rng):
+    password = hash_password(SEED_PASSWORD)
+    for i in range(1, counts["users"] + 1):
+        await writer.add(User, {
+            "id": i, "name": f"User {i}", "username": f"user{i}", "email": f"user{i}{SEED_DOMAIN}",
+            "password": password, "bio": sentence(rng, 3, 12), "role": "user", "created_at": spread(i, counts["users"]),
+        })
+    await writer.flush()
+
+
+async def seed_communities(writer, counts, rng):
+    for i in range(1, counts["communities"] + 1):
+        await writer.add(Community, {
+            "id": i, "name": f"community {i}", "description": sentence(rng), "owner_id": skewed(rng, counts["users"]),
+            "last_activity_at": EPOCH,
+        })
+    await writer.flush()
+
+    remaining, average = counts["memberships"], counts["memberships"] / counts["users"]
+    for user_id in range(1, counts["users"] + 1):
+        wanted = min(remaining, counts["communities"], rng.randint(0, round(2 * average)))
+        joined = set()
+        for _ in range(4 * wanted):
+            if len(joined) == wanted:
+                break
+            joined.add(skewed(rng, counts["communities"]))
+        for community_id in sorted(joined):
+            await writer.add(CommunityMembership, {"user_id": user_id, "community_id": community_id})
+        remaining -= len(joined)
+    await writer.flush()
+
+
+async def seed_posts(writer, counts, rng):
+    for i in range(1, counts["posts"] + 1):
+        created_at = spread(i, counts["posts"])
+        await writer.add(Post, {
+            "id": i, "content": sentence(rng), "owner_id": rng.randint(1, counts["users"]),
+            "community_id": skewed(rng, counts["communities"]) if rng.random() < 0.7 else None,
+            "created_at": created_at, "updated_at": created_at,
+        })
+    await writer.flush()
+
+
+async def seed_comments(writer, counts, rng):
+    comment_id = 0
+    targets = [("post_id", counts["posts"], int(counts["comments"] * 0.9)),
+               ("event_id", counts["events"], counts["comments"] - int(counts["comments"] * 0.9))]
+    for column, parents, total in targets:
+        average, written = total / parents, 0
+        for parent_id in range(1, parents + 1):
+            thread = []
+            for _ in range(min(total - written, rng.randint(0, round(2 * average)))):
+                comment_id += 1
+                await writer.add(Comment, {
+                    "id": comment_id, "content": sentence(rng, 2, 20), "user_id": rng.randint(1, counts["users"]),
+                    column: parent_id,
+                    "reply_to_comment_id": rng.choice(thread) if thread and rng.random() < 0.6 else None,
+                    "created_at": spread(parent_id, parents) + timedelta(minutes=len(thread)),
+                })
+                thread.append(comment_id)
+            written += len(thread)
+    await writer.flush()
+
+    remaining, average = counts["likes"], counts["likes"] / counts["posts"]
+    for post_id in range(1, counts["posts"] + 1):
+        wanted = min(remaining, counts["users"], rng.randint(0, round(2 * average)))
+        for user_id in sorted(rng.sample(range(1, counts["users"] + 1), wanted)):
+            await writer.add(Like, {"user_id": user_id, "post_id": post_id})
+        remaining -= wanted
+    await writer.flush()
+
+
+async def seed_events(writer, counts, rng):
+    for i in range(1, counts["events"] + 1):
+        await writer.add(Event, {
+            "id": i, "title": sentence(rng, 2, 6), "description": sentence(rng), "location": f"Hall {rng.randint(1, 20)}",
+            "event_date": spread(i, counts["events"], 2 * SPAN), "updated_at": spread(i, counts["events"]),
+        })
+    for i in range(1, counts["announcements"] + 1):
+        created_at = spread(i, counts["announcements"])
+        await writer.add(Announcement, {
+            "id": i, "content": sentence(rng), "owner_id": skewed(rng, counts["users"]),
+            "created_at": created_at, "updated_at": created_at,
+        })
+    await writer.flush()
+
+
+async def derive(db):
+    # Timelines as fan-out on write would have built them: every post for
+    # its author, and for the members of communities small enough to fan out.
+    await db.execute(text(
+        "INSERT INTO timeline_entries (user_id, post_id, community_id, created_at) "
+        "SELECT owner_id, id, community_id, created_at FROM posts "
+        "UNION "
+        "SELECT community_membership.user_id, posts.id, posts.community_id, posts.created_at "
+        "FROM posts JOIN community_membership ON community_membership.community_id = posts.community_id "
+        "JOIN communities ON communities.id = posts.community_id "
+        "WHERE communities.member_count <= :threshold"
+    ), {"threshold": settings.FEED_FANOUT_THRESHOLD})
+    await db.commit()
+
+
+async def seed(db, counts: dict, rng, progress=None) -> dict:
+    # Returns the rows written per table; `progress` is called with the name
+    # of each step as it finishes.
+    writer = BatchWriter(db)
+    for step in (seed_users, seed_communities, seed_posts, seed_events, seed_comments):
+        await step(writer, counts, rng)
+        if progress:
+            progress(step.__name__)
+
+    # Member, post and like counters come from the app's own repair jobs.
+    await verify_community_stats()
+    await reconcile_like_counts(settle_seconds=0)
+    await derive(db)
+
+    if db.bind.dialect.name == "postgresql":
+        # Rows were written with explicit ids; move the sequences past them.
+        for model in (User, Community, Post, Comment, Event, Announcement):
+            table = model.__tablename__
+            await db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"))
+    await db.execute(text("ANALYZE"))
+    await db.commit()
+    return writer.written
+
+
+async def main(args):
+    if args.create_schema:
+        async with async_engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(select(User.id).limit(1)) is not None:
+            raise SystemExit("benchmarks.seed expects an empty database")
+
+        written = await seed(
+            db, plan(args.scale), random.Random(args.seed),
+            lambda step: print(f"{step:16} {time.perf_counter() - started:8.1f}s"),
+        )
+
+    print(f"{'table':22} {'rows':>10}")
+    for table, rows in written.items():
+        print(f"{table:22} {rows:10}")
+    print(f"seeded in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=10000, help="approximate number of rows, e.g. 10000 to 10000000")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--create-schema", action="store_true", help="create the tables from the models first")
+    asyncio.run(main(parser.parse_args()))
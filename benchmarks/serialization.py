@@ -0,0 +1,83 @@
+"""Compare FastAPI's response_model serialization with utils.serialization.render,
+nested and ?shape=normalized, for one page of posts without a database or server.
+
+    python -m benchmarks.serialization --posts 100 --comments 3 --repeat 200
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import List
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from api.models.user import Comment, Post, User
+from api.schemas.user import PostResponse
+from utils.serialization import SHAPE_NORMALIZED, render
+
+
+def build_page(posts, comments):
+    users = [
+        User(id=i, name=f"user {i}", email=f"user{i}@example.com", bio="bio", username=f"user{i}",
+             profile_image="https://example.com/images/ab/" + "0" * 64 + ".jpg", role="user")
+        for i in range(10)
+    ]
+    return [
+        Post(
+            id=i,
+            content="post body " * 20,
+            post_image=None,
+            created_at=datetime.now(),
+            owner_id=users[i % 10].id,
+            owner=users[i % 10],
+            community_id=None,
+            comments=[
+                Comment(id=i * comments + j, content="a comment", created_at=datetime.now(), post_id=i,
+                        user=users[j % 10])
+                for j in range(comments)
+            ],
+        )
+        for i in range(posts)
+    ]
+
+
+async def response_model_path(field, page):
+    content = await serialize_response(field=field, response_content=page, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def render_path(field, page):
+    return render(List[PostResponse], page).body
+
+
+async def normalized_path(field, page):
+    return render(List[PostResponse], page, shape=SHAPE_NORMALIZED).body
+
+
+async def measure(path, field, page, repeat):
+    await path(field, page)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = await path(field, page)
+    return (time.perf_counter() - started) / repeat * 1000, len(body)
+
+
+async def main(args):
+    page = build_page(args.posts, args.comments)
+    field = create_response_field(name="response", type_=List[PostResponse], mode="serialization")
+
+    print(f"{'path':16} {'ms/page':>8} {'bytes':>8}")
+    results = {}
+    for name, path in (("response_model", response_model_path), ("render", render_path), ("normalized", normalized_path)):
+        results[name], size = await measure(path, field, page, args.repeat)
+        print(f"{name:16} {results[name]:8.2f} {size:8}")
+    for name in ("render", "normalized"):
+        print(f"{name + ' speedup':16} {results['response_model'] / results[name]:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--comments", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -1,3 +1,4 @@
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
 
 
@@ -8,13 +9,55 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     POSTGRES_USER: str
     SQLALCHEMY_DATABASE_URL: str
+    ASYNC_SQLALCHEMY_DATABASE_URL: Optional[str] = None
+    REPLICA_DATABASE_URL: Optional[str] = None
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_RETRY_SECONDS: int = 30
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 15000
+    ROUTE_STATEMENT_TIMEOUTS_MS: Dict[str, int] = {"/users/all/search": 2000, "/communities/all/search": 2000}
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_MAX_SIZE: int = 10000
+    MEMBERSHIP_CACHE_TTL_SECONDS: int = 300
+    MEMBERSHIP_CACHE_MAX_SIZE: int = 10000
+    FEED_FANOUT_THRESHOLD: int = 1000
+    FEED_BACKFILL_POSTS: int = 50
+    COMMUNITY_SIZE_CACHE_TTL_SECONDS: int = 300
+    COMMUNITY_STATS_VERIFY_INTERVAL_SECONDS: int = 3600
+    THREAD_MAX_NODES: int = 500
+    LIKE_FLUSH_INTERVAL_SECONDS: float = 2.0
+    LIKE_RECONCILE_INTERVAL_SECONDS: int = 3600
+    SYNC_SETTLE_SECONDS: int = 5
+    SYNC_TOMBSTONE_RETENTION_DAYS: int = 30
+    HTTP_CACHE_BACKEND: str = "memory"
+    HTTP_CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    HTTP_CACHE_MAX_ENTRIES: int = 2048
+    HTTP_CACHE_TTL_SECONDS: int = 300
+    HTTP_CACHE_MAX_TAGS: int = 100000
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_DEPTH: int = 16
+    SLOW_QUERY_MS: int = 200
+    METRICS_TOKEN: Optional[str] = None
+    PROFILING_ENABLED: bool = False
+    PROFILE_DIR: str = "profiles"
+    PROFILE_INTERVAL_SECONDS: float = 0.001
     BUCKET_NAME: str
     REGION: str
     ACCESS_KEY: str
     SECRET_ACCESS: str
+    STORAGE_BACKEND: str = "s3"
+    LOCAL_STORAGE_ROOT: str = "media"
+    LOCAL_STORAGE_URL: str = "/media"
+    UPLOAD_CHUNK_SIZE: int = 8 * 1024 * 1024
+    S3_MAX_POOL_CONNECTIONS: int = 10
 
     class Config:
         env_file=".env"
@@ -1,19 +1,159 @@
-from sqlalchemy import create_engine
+import logging
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from config.config import settings
+from utils.cache import TTLCache
+from utils.metrics import current_route, instrument_engine, timed_pool
+
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# Pools a request can wait on for a free connection; checkouts are timed for
+# /metrics. SQLite opens a connection per checkout instead.
+TIMED_POOLS = {"postgresql": AsyncAdaptedQueuePool}
+
+
+# Requests that only read; any other method may write.
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# SQLSTATE of a unique constraint violation on Postgres.
+UNIQUE_VIOLATION = "23505"
+
+
+def async_database_url(url: str) -> str:
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername)).render_as_string(hide_password=False)
+
+
+def pool_options() -> dict:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def engine_options(url: str) -> dict:
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    # The default statement timeout is a session setting from connect time,
+    # so it costs nothing per query; routes can lower it per transaction.
+    timeout = str(settings.DB_STATEMENT_TIMEOUT_MS)
+    return {**pool_options(), "connect_args": {"options": f"-c statement_timeout={timeout}"}}
+
+
+def async_engine_options(url: str, name: str) -> dict:
+    pool_class = TIMED_POOLS.get(make_url(url).get_backend_name())
+    if pool_class is None:
+        return {}
+    timeout = str(settings.DB_STATEMENT_TIMEOUT_MS)
+    return {**pool_options(), "poolclass": timed_pool(pool_class, name), "connect_args": {"server_settings": {"statement_timeout": timeout}}}
+
+
+def create_routed_engine(url: str, name: str):
+    async_url = async_database_url(url)
+    routed = create_async_engine(async_url, **async_engine_options(async_url, name))
+    instrument_engine(routed.sync_engine, name)
+    return routed
 
 
 SQLALCHEMY_DATABASE_URL = f"{settings.SQLALCHEMY_DATABASE_URL}"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+ASYNC_SQLALCHEMY_DATABASE_URL = settings.ASYNC_SQLALCHEMY_DATABASE_URL or async_database_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_routed_engine(ASYNC_SQLALCHEMY_DATABASE_URL, "primary")
+
+# Objects are kept loaded after commit so handlers can return them without
+# another round trip; anything serialized must be loaded up front since
+# lazy loading is not available on an AsyncSession.
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+replica_engine = create_routed_engine(settings.REPLICA_DATABASE_URL, "replica") if settings.REPLICA_DATABASE_URL else None
+ReplicaSessionLocal = async_sessionmaker(replica_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False) if replica_engine else None
+
+replica_down = TTLCache("replica_down", 1, settings.REPLICA_RETRY_SECONDS)
+
 Base = declarative_base()
 
+
+@event.listens_for(Session, "after_begin")
+def set_route_statement_timeout(session, transaction, connection):
+    timeout = settings.ROUTE_STATEMENT_TIMEOUTS_MS.get(current_route())
+    if timeout is not None and connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+def is_unique_violation(error: IntegrityError) -> bool:
+    # Lets create routes insert directly and map a duplicate to a 400 rather
+    # than checking for one first, which also closes the race between the
+    # check and the insert.
+    code = getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
+    if code is not None:
+        return code == UNIQUE_VIOLATION
+    return "UNIQUE constraint failed" in str(error.orig)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db(request: Request):
+    if replica_engine is not None and request.method not in SAFE_METHODS:
+        # Marked before the write rather than after its commit, so the
+        # window is open by the time the response reaches the client.
+        # Imported here since utils.http_cache imports this module.
+        from utils.http_cache import remember_writer
+        await remember_writer(request)
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def replica_session(request: Request):
+    if ReplicaSessionLocal is None or replica_down.get("replica"):
+        return None
+    from utils.http_cache import is_recent_writer
+    if await is_recent_writer(request):
+        return None
+    # Cache fills for pages invalidated within the lag window could store
+    # what the replica hasn't caught up on yet; see ResponseCache.serve.
+    if not getattr(request.state, "replica_allowed", True):
+        return None
+
+    db = ReplicaSessionLocal()
+    try:
+        await db.connection()
+    except (DBAPIError, OSError):
+        await db.close()
+        logger.warning("Read replica unavailable, reading from the primary for %ss", settings.REPLICA_RETRY_SECONDS, exc_info=True)
+        replica_down.set("replica", True)
+        return None
+    return db
+
+
+async def get_read_db(request: Request):
+    # For read-only handlers: the replica when one is configured and up,
+    # otherwise the primary.
+    db = await replica_session(request)
+    if db is None:
+        db = AsyncSessionLocal()
+    async with db:
+        yield db
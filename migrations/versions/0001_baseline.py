@@ -0,0 +1,92 @@
+"""Baseline schema, as created by Base.metadata.create_all before migrations
+
+Databases created that way are brought under migrations with
+`alembic stamp 0001`, then `alembic upgrade head`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2023-10-04
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+now = sa.text("now()")
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False, unique=True),
+        sa.Column("bio", sa.Text()),
+        sa.Column("profile_image", sa.String()),
+        sa.Column("username", sa.String(), nullable=False, unique=True),
+        sa.Column("password", sa.String(), nullable=False),
+        sa.Column("role", sa.String()),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=now),
+    )
+    op.create_table(
+        "communities",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("name", sa.String(), nullable=False, unique=True),
+        sa.Column("description", sa.Text()),
+        sa.Column("owner_id", sa.Integer(), sa.ForeignKey("users.id")),
+    )
+    op.create_table(
+        "community_membership",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("community_id", sa.Integer(), sa.ForeignKey("communities.id"), primary_key=True),
+    )
+    op.create_table(
+        "posts",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("content", sa.String(), nullable=False),
+        sa.Column("post_image", sa.String()),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=now),
+        sa.Column("owner_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("community_id", sa.Integer(), sa.ForeignKey("communities.id")),
+    )
+    op.create_table(
+        "events",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("description", sa.Text()),
+        sa.Column("event_date", sa.String()),
+        sa.Column("location", sa.String()),
+        sa.Column("image", sa.String()),
+    )
+    op.create_table(
+        "announcements",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("content", sa.String(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=now),
+        sa.Column("updated_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=now),
+        sa.Column("owner_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    )
+    op.create_table(
+        "comments",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("content", sa.String(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=now),
+        sa.Column("event_id", sa.Integer(), sa.ForeignKey("events.id", ondelete="CASCADE")),
+        sa.Column("post_id", sa.Integer(), sa.ForeignKey("posts.id", ondelete="CASCADE")),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("reply_to_comment_id", sa.Integer(), sa.ForeignKey("comments.id")),
+    )
+    op.create_table(
+        "likes",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("post_id", sa.Integer(), sa.ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True),
+    )
+
+
+def downgrade():
+    for table in ("likes", "comments", "announcements", "events", "posts", "community_membership", "communities", "users"):
+        op.drop_table(table)
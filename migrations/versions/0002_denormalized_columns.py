@@ -0,0 +1,118 @@
+"""Counters, timestamps, typed event dates, timelines and tombstones
+
+Adds the columns and tables the API has grown since the baseline and
+backfills them from existing rows: like and community counters, updated_at
+for delta sync, home feed timelines, and event_date converted from free-form
+strings to UTC timestamps. The original strings are kept in
+events.event_date_text; the conversion stops without changing anything if
+a value can't be parsed, listing the offending events.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from datetime import timezone
+from alembic import op
+import sqlalchemy as sa
+from dateutil import parser as date_parser
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+now = sa.text("now()")
+
+
+def parse_event_date(value):
+    parsed = date_parser.parse(value)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def convert_event_dates():
+    connection = op.get_bind()
+    parsed, failed = {}, []
+    for id, value in connection.execute(sa.text("SELECT id, event_date FROM events")):
+        try:
+            parsed[id] = parse_event_date(value)
+        except (TypeError, ValueError, OverflowError):
+            failed.append(f"event {id}: {value!r}")
+    if failed:
+        raise RuntimeError("Can't parse these event dates, fix them and run again:\n" + "\n".join(failed))
+
+    op.alter_column("events", "event_date", new_column_name="event_date_text")
+    op.add_column("events", sa.Column("event_date", sa.TIMESTAMP(timezone=True)))
+    if parsed:
+        connection.execute(
+            sa.text("UPDATE events SET event_date = :event_date WHERE id = :id").bindparams(
+                sa.bindparam("event_date", type_=sa.TIMESTAMP(timezone=True))
+            ),
+            [{"id": id, "event_date": value} for id, value in parsed.items()],
+        )
+    op.alter_column("events", "event_date", nullable=False)
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    op.add_column("posts", sa.Column("like_count", sa.Integer(), nullable=False, server_default=sa.text("0")))
+    op.add_column("posts", sa.Column("updated_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=now))
+    op.execute("UPDATE posts SET updated_at = created_at")
+    op.execute(
+        "UPDATE posts SET like_count = counted.likes "
+        "FROM (SELECT post_id, count(*) AS likes FROM likes GROUP BY post_id) AS counted "
+        "WHERE counted.post_id = posts.id"
+    )
+
+    op.add_column("communities", sa.Column("member_count", sa.Integer(), nullable=False, server_default=sa.text("0")))
+    op.add_column("communities", sa.Column("post_count", sa.Integer(), nullable=False, server_default=sa.text("0")))
+    op.add_column("communities", sa.Column("last_activity_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=now))
+    op.execute(
+        "UPDATE communities SET "
+        "member_count = (SELECT count(*) FROM community_membership WHERE community_id = communities.id), "
+        "post_count = (SELECT count(*) FROM posts WHERE community_id = communities.id), "
+        "last_activity_at = coalesce((SELECT max(created_at) FROM posts WHERE community_id = communities.id), last_activity_at)"
+    )
+
+    convert_event_dates()
+    op.add_column("events", sa.Column("updated_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=now))
+
+    op.create_table(
+        "timeline_entries",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("post_id", sa.Integer(), sa.ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("community_id", sa.Integer(), sa.ForeignKey("communities.id", ondelete="CASCADE")),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+    # Every reader's existing feed: their own posts and their communities'.
+    op.execute(
+        "INSERT INTO timeline_entries (user_id, post_id, community_id, created_at) "
+        "SELECT owner_id, id, community_id, created_at FROM posts "
+        "UNION "
+        "SELECT community_membership.user_id, posts.id, posts.community_id, posts.created_at "
+        "FROM posts JOIN community_membership ON community_membership.community_id = posts.community_id"
+    )
+    op.create_index("ix_timeline_entries_user_id_created_at_post_id", "timeline_entries", ["user_id", "created_at", "post_id"])
+
+    op.create_table(
+        "tombstones",
+        sa.Column("resource", sa.String(), primary_key=True),
+        sa.Column("resource_id", sa.Integer(), primary_key=True),
+        sa.Column("deleted_at", sa.TIMESTAMP(timezone=True), nullable=False),
+    )
+    op.create_index("ix_tombstones_resource_deleted_at_resource_id", "tombstones", ["resource", "deleted_at", "resource_id"])
+
+
+def downgrade():
+    op.drop_table("tombstones")
+    op.drop_table("timeline_entries")
+    op.drop_column("events", "updated_at")
+    op.drop_column("events", "event_date")
+    op.alter_column("events", "event_date_text", new_column_name="event_date")
+    for column in ("last_activity_at", "post_count", "member_count"):
+        op.drop_column("communities", column)
+    op.drop_column("posts", "updated_at")
+    op.drop_column("posts", "like_count")
@@ -0,0 +1,53 @@
+"""Indexes for foreign keys, listing sort keys and search
+
+Built with CREATE INDEX CONCURRENTLY so existing tables stay writable while
+they build. Each one backs a query the API runs on every request of some
+route; tests/test_query_plans.py checks that they are still used.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_posts_created_at_id", "posts", "(created_at, id)"),
+    ("ix_posts_community_id_created_at_id", "posts", "(community_id, created_at, id)"),
+    ("ix_posts_owner_id_created_at_id", "posts", "(owner_id, created_at, id)"),
+    ("ix_posts_updated_at_id", "posts", "(updated_at, id)"),
+    ("ix_comments_post_id_reply_to_comment_id_created_at_id", "comments", "(post_id, reply_to_comment_id, created_at, id)"),
+    ("ix_comments_event_id_reply_to_comment_id_created_at_id", "comments", "(event_id, reply_to_comment_id, created_at, id)"),
+    ("ix_comments_reply_to_comment_id_created_at_id", "comments", "(reply_to_comment_id, created_at, id)"),
+    ("ix_comments_user_id", "comments", "(user_id)"),
+    ("ix_community_membership_community_id_user_id", "community_membership", "(community_id, user_id)"),
+    ("ix_communities_member_count_id", "communities", "(member_count, id)"),
+    ("ix_communities_last_activity_at_id", "communities", "(last_activity_at, id)"),
+    ("ix_announcements_created_at_id", "announcements", "(created_at, id)"),
+    ("ix_announcements_updated_at_id", "announcements", "(updated_at, id)"),
+    ("ix_events_event_date_id", "events", "(event_date, id)"),
+    ("ix_events_updated_at_id", "events", "(updated_at, id)"),
+    ("ix_likes_post_id", "likes", "(post_id)"),
+    ("ix_users_username_prefix", "users", '(lower(username) COLLATE "C")'),
+    ("ix_users_username_trgm", "users", "USING gin (lower(username) gin_trgm_ops)"),
+    ("ix_communities_name_prefix", "communities", '(lower(name) COLLATE "C")'),
+    ("ix_communities_name_trgm", "communities", "USING gin (lower(name) gin_trgm_ops)"),
+    ("ix_communities_description_trgm", "communities", "USING gin (lower(description) gin_trgm_ops)"),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {columns}")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,96 @@
+import os
+import tempfile
+
+# Settings are read when the app is imported, so the environment is pointed
+# at a scratch aiosqlite database and local upload storage first. Values a
+# developer's .env provides for the remaining required settings are kept.
+TEST_DIR = tempfile.mkdtemp(prefix="schola-tests-")
+os.environ.update({
+    "SQLALCHEMY_DATABASE_URL": f"sqlite:///{TEST_DIR}/test.db",
+    "ASYNC_SQLALCHEMY_DATABASE_URL": f"sqlite+aiosqlite:///{TEST_DIR}/test.db",
+    "REPLICA_DATABASE_URL": "",
+    "HTTP_CACHE_BACKEND": "memory",
+    "METRICS_TOKEN": "test-metrics-token",
+    "STORAGE_BACKEND": "local",
+    "LOCAL_STORAGE_ROOT": os.path.join(TEST_DIR, "media"),
+    "BCRYPT_ROUNDS": "4",
+})
+for name, value in {
+    "POSTGRES_SERVER": "localhost", "POSTGRES_PORT": "5432", "POSTGRES_PASSWORD": "test", "POSTGRES_DB": "test",
+    "POSTGRES_USER": "test", "SECRET_KEY": "test", "ALGORITHM": "HS256", "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "BUCKET_NAME": "test", "REGION": "test", "ACCESS_KEY": "test", "SECRET_ACCESS": "test",
+}.items():
+    os.environ.setdefault(name, value)
+
+import random
+import httpx
+import pytest
+from sqlalchemy import event
+from app import app
+from benchmarks.seed import plan, seed
+from database.db import AsyncSessionLocal, Base, async_engine
+from utils.cache import caches
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    # A fresh schema per test; the per-process caches are emptied with it so
+    # no test sees users, memberships or responses from another.
+    async with async_engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+    for cache in caches.values():
+        cache.clear()
+    yield
+    await async_engine.dispose()
+
+
+# Small enough to seed in about a second, large enough that every list
+# route has full pages and every community has posts.
+SEED_SCALE = 2000
+
+
+@pytest.fixture
+async def seeded(database):
+    # benchmarks.seed's dataset at SEED_SCALE; returns its plan() counts.
+    counts = plan(SEED_SCALE)
+    async with AsyncSessionLocal() as db:
+        await seed(db, counts, random.Random(1))
+    return counts
+
+
+@pytest.fixture
+async def client(database):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def sign_up(client):
+    async def sign_up(name: str = "alice") -> dict:
+        user = {"name": f"{name} tester", "email": f"{name}@example.com", "bio": "bio", "username": f"{name}_tester", "password": "password"}
+        response = await client.post("/users/", json=user)
+        assert response.status_code == 201, response.text
+        response = await client.post("/login", data={"username": user["email"], "password": user["password"]})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return sign_up
+
+
+@pytest.fixture
+def statements():
+    # SQL sent to the primary while the test runs, in order.
+    executed = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
@@ -0,0 +1,59 @@
+import pytest
+
+
+pytestmark = pytest.mark.anyio
+
+USER = {"name": "alice tester", "email": "alice@example.com", "bio": "bio", "username": "alice_tester", "password": "password"}
+COMMUNITY = {"name": "readers", "description": "books"}
+
+# (label, method, path, request kwargs, expected status, statement budget)
+# in the order they run. Paths are formatted with the ids of what earlier
+# steps created; steps without a budget only set up later ones. Creates
+# take one or two statements; a community post takes three, since it also
+# fans out to timelines and bumps the community's counters. A sign-up
+# looks for an existing account before hashing the password. Logging in
+# first loads the user, so the cached lookup later requests share is left
+# out of their counts.
+STEPS = [
+    ("sign up", "POST", "/users/", {"json": USER}, 201, 2),
+    ("duplicate sign up", "POST", "/users/", {"json": USER}, 400, 1),
+    ("log in", "POST", "/login", {"data": {"username": USER["email"], "password": USER["password"]}}, 200, None),
+    ("load the user", "GET", "/users/profile/me", {}, 200, None),
+    ("community", "POST", "/communities/", {"json": COMMUNITY}, 200, 1),
+    ("community post before joining", "POST", "/communities/{community}/posts", {"data": {"content": "c"}}, 403, 2),
+    ("duplicate community", "POST", "/communities/", {"json": COMMUNITY}, 400, 1),
+    ("join", "POST", "/communities/join/{community}", {}, 202, None),
+    ("community post", "POST", "/communities/{community}/posts", {"data": {"content": "c"}}, 201, 3),
+    ("community post comment", "POST", "/communities/{community}/posts/{community_post}/comments", {"json": {"content": "c"}}, 201, 2),
+    ("post", "POST", "/posts/", {"data": {"content": "c"}}, 201, 2),
+    ("post comment", "POST", "/posts/{post}/comments", {"json": {"content": "c"}}, 201, 2),
+    ("missing post comment", "POST", "/posts/0/comments", {"json": {"content": "c"}}, 404, 1),
+    ("reply", "POST", "/comments/{post_comment}/replies", {"json": {"content": "c"}}, 201, 2),
+    ("event", "POST", "/events/", {"data": {"title": "t", "description": "d", "event_date": "2030-01-01T10:00:00Z", "location": "l"}}, 201, 1),
+    ("event comment", "POST", "/events/{event}/comments", {"json": {"content": "c"}}, 201, 1),
+    ("announcement", "POST", "/announcements/", {"json": {"content": "c"}}, 201, 1),
+]
+
+# Which id a step's response provides to later paths.
+CREATED = {
+    "community": "community",
+    "community post": "community_post",
+    "post": "post",
+    "post comment": "post_comment",
+    "event": "event",
+}
+
+
+@pytest.mark.parametrize("step", [step for step in STEPS if step[5] is not None], ids=lambda step: step[0])
+async def test_create_statements(step, client, statements):
+    ids = {}
+    for label, method, path, kwargs, expected, budget in STEPS[:STEPS.index(step) + 1]:
+        statements.clear()
+        response = await client.request(method, path.format(**ids), **kwargs)
+        assert response.status_code == expected, f"{label}: {response.text}"
+        if label in CREATED:
+            ids[CREATED[label]] = response.json()["id"]
+        if label == "log in":
+            client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+    assert len(statements) <= step[5], "\n\n".join(statements)
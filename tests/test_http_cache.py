@@ -0,0 +1,81 @@
+import asyncio
+import re
+from datetime import datetime, timedelta, timezone
+import pytest
+from starlette.requests import Request
+import database.db
+import utils.cache
+from config.config import settings
+from utils.http_cache import MemoryBackend, is_recent_writer
+from utils.oauth2 import create_access_token
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_evicted_tags_stay_invalidated(monkeypatch):
+    monkeypatch.setattr(utils.cache, "caches", {})
+    monkeypatch.setattr(settings, "HTTP_CACHE_MAX_TAGS", 2)
+    backend = MemoryBackend()
+
+    filled = await backend.get_versions(["post:1"])
+    await backend.bump(["post:1"])
+    await backend.bump(["post:2", "post:3"])
+
+    assert backend.versions.stats()["size"] == 2
+    assert await backend.get_versions(["post:1"]) != filled
+
+
+def metric(body: str, sample: str) -> float:
+    match = re.search(rf"^{re.escape(sample)} (\S+)$", body, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+async def test_cache_counters_are_exported(client):
+    scraper = {"Authorization": f"Bearer {settings.METRICS_TOKEN}"}
+    before = (await client.get("/metrics", headers=scraper)).text
+    first = await client.get("/announcements/")
+    await client.get("/announcements/")
+    await client.get("/announcements/", headers={"If-None-Match": first.headers["etag"]})
+    after = (await client.get("/metrics", headers=scraper)).text
+
+    assert metric(after, 'http_cache_lookups_total{result="miss"}') - metric(before, 'http_cache_lookups_total{result="miss"}') == 1
+    assert metric(after, 'http_cache_lookups_total{result="hit"}') - metric(before, 'http_cache_lookups_total{result="hit"}') == 2
+    assert metric(after, "http_cache_not_modified_total") - metric(before, "http_cache_not_modified_total") == 1
+    assert metric(after, 'http_cache_size{kind="responses"}') >= 1
+
+
+async def test_upcoming_events_expire_when_the_first_starts(client, sign_up):
+    headers = await sign_up()
+    starts = datetime.now(timezone.utc) + timedelta(seconds=1)
+    event = {"title": "exam", "description": "finals", "event_date": starts.isoformat(), "location": "hall"}
+    await client.post("/events/", data=event, headers=headers)
+
+    response = await client.get("/events/?upcoming=true")
+    assert [item["title"] for item in response.json()] == ["exam"]
+    assert "expires" in response.headers
+
+    await asyncio.sleep(1.2)
+    assert (await client.get("/events/?upcoming=true")).json() == []
+
+
+async def test_metrics_are_closed_by_default(client, monkeypatch):
+    assert (await client.get("/metrics")).status_code == 401
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+    assert (await client.get("/metrics", headers={"Authorization": "Bearer "})).status_code == 404
+
+
+def bearer(token: str) -> Request:
+    return Request({"type": "http", "method": "GET", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+
+
+async def test_writes_pin_the_user_not_the_token(client, sign_up, monkeypatch):
+    monkeypatch.setattr(database.db, "replica_engine", object())
+    headers = await sign_up()
+    user_id = (await client.get("/users/profile/me", headers=headers)).json()["id"]
+    other_device = bearer(create_access_token({"user_id": user_id, "device": "phone"}))
+    assert not await is_recent_writer(other_device)
+
+    await client.post("/posts/", data={"content": "hi"}, headers=headers)
+    assert await is_recent_writer(other_device)
+    assert not await is_recent_writer(bearer(create_access_token({"user_id": user_id + 1})))
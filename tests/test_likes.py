@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from sqlalchemy import select
+from api.likes import apply_deltas, reconcile_like_counts
+from api.models.user import Like, Post
+from config.config import settings
+from database.db import AsyncSessionLocal
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_posts(client, headers, count: int) -> list:
+    ids = []
+    for number in range(count):
+        response = await client.post("/posts/", data={"content": f"post {number}"}, headers=headers)
+        ids.append(response.json()["id"])
+    return ids
+
+
+async def like_counts(ids) -> list:
+    async with AsyncSessionLocal() as db:
+        counts = dict((await db.execute(select(Post.id, Post.like_count).where(Post.id.in_(ids)))).all())
+    return [counts[id] for id in ids]
+
+
+async def test_reconcile_leaves_other_workers_deltas(client, sign_up):
+    headers = await sign_up()
+    user_id = (await client.get("/users/profile/me", headers=headers)).json()["id"]
+    busy, lost = await create_posts(client, headers, 2)
+    async with AsyncSessionLocal() as db:
+        db.add_all([Like(user_id=user_id, post_id=busy), Like(user_id=user_id, post_id=lost)])
+        await db.commit()
+
+    async def other_worker_flush():
+        # Another process still holds the +1 for `busy` and flushes it while
+        # the reconcile waits; `lost` has no delta anywhere.
+        await asyncio.sleep(0.1)
+        async with AsyncSessionLocal() as db:
+            await db.execute(apply_deltas, [{"post": busy, "delta": 1}])
+            await db.commit()
+
+    repaired, _ = await asyncio.gather(reconcile_like_counts(settle_seconds=0.3), other_worker_flush())
+
+    assert repaired == 1
+    assert await like_counts([busy, lost]) == [1, 1]
+
+
+async def test_liked_by_me_is_per_viewer(client, sign_up, monkeypatch):
+    monkeypatch.setattr(settings, "SYNC_SETTLE_SECONDS", 0)
+    alice, bob = await sign_up("alice"), await sign_up("bob")
+    post, = await create_posts(client, alice, 1)
+    response = await client.post(f"/posts/{post}/like", headers=alice)
+    assert response.status_code == 202
+
+    for headers, liked in ((alice, True), (bob, False), ({}, False), (alice, True)):
+        assert (await client.get(f"/posts/{post}/", headers=headers)).json()["liked_by_me"] is liked
+        assert (await client.get("/posts/", headers=headers)).json()[0]["liked_by_me"] is liked
+        assert (await client.get("/posts/sync", headers=headers)).json()["changes"][0]["liked_by_me"] is liked
@@ -0,0 +1,38 @@
+import ast
+import re
+from pathlib import Path
+from database.db import Base
+
+
+VERSIONS = Path(__file__).resolve().parent.parent / "migrations" / "versions"
+
+
+def migration_indexes() -> dict:
+    # name -> (table, columns) for the indexes 0002 and 0003 create; columns
+    # is None for expression indexes. Read from the source so the migrations
+    # don't have to run: the suite builds its schema with create_all.
+    indexes = {}
+    tree = ast.parse((VERSIONS / "0002_denormalized_columns.py").read_text())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "create_index":
+            name, table, columns = (ast.literal_eval(arg) for arg in node.args)
+            indexes[name] = (table, tuple(columns))
+
+    tree = ast.parse((VERSIONS / "0003_index_pack.py").read_text())
+    pack = next(node.value for node in tree.body if isinstance(node, ast.Assign) and node.targets[0].id == "INDEXES")
+    for name, table, columns in ast.literal_eval(pack):
+        plain = re.fullmatch(r"\(([\w, ]+)\)", columns)
+        indexes[name] = (table, tuple(plain.group(1).split(", ")) if plain else None)
+    return indexes
+
+
+def model_indexes() -> dict:
+    return {
+        index.name: (table.name, tuple(column.name for column in index.columns) or None)
+        for table in Base.metadata.tables.values()
+        for index in table.indexes
+    }
+
+
+def test_migrations_create_the_model_indexes():
+    assert migration_indexes() == model_indexes()
@@ -0,0 +1,57 @@
+import pytest
+from sqlalchemy import func, select
+from api.models.user import Comment, Post
+from benchmarks.seed import SEED_DOMAIN, SEED_PASSWORD
+from database.db import AsyncSessionLocal
+
+
+pytestmark = pytest.mark.anyio
+
+# Upper bound on the statements one request to each post route may send,
+# whatever the page holds: owners, comments and comment authors are loaded
+# in batches, never per row. Routes that report liked_by_me also look up
+# a signed-in viewer and which of the posts they liked.
+ROUTES = {
+    "posts": ("/posts/?limit=10", 2, True),
+    "post": ("/posts/{post}/", 2, True),
+    "community posts": ("/communities/{community}/posts?limit=10", 3, True),
+    "community post": ("/communities/{community}/posts/{post}", 3, True),
+    "post comments": ("/posts/{post}/comments", 2, False),
+    "post comment thread": ("/posts/{post}/comments/thread?limit=10", 2, False),
+    "community post comments": ("/communities/{community}/posts/{post}/comments", 3, False),
+}
+VIEWER_STATEMENTS = 2
+
+
+async def busiest_community_post() -> dict:
+    # The community post with the most comments, so comment loading is
+    # exercised on a full thread.
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(Post.id, Post.community_id)
+            .join(Comment, Comment.post_id == Post.id)
+            .where(Post.community_id.is_not(None))
+            .group_by(Post.id, Post.community_id)
+            .order_by(func.count().desc())
+            .limit(1)
+        )).one()
+    return {"post": row.id, "community": row.community_id}
+
+
+@pytest.mark.parametrize("signed_in", [False, True], ids=["anonymous", "signed in"])
+@pytest.mark.parametrize("route", ROUTES)
+async def test_post_route_statements(route, signed_in, seeded, client, statements):
+    path, budget, per_viewer = ROUTES[route]
+    path = path.format(**await busiest_community_post())
+    headers = {}
+    if signed_in:
+        response = await client.post("/login", data={"username": f"user1{SEED_DOMAIN}", "password": SEED_PASSWORD})
+        headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        budget += VIEWER_STATEMENTS if per_viewer else 0
+
+    statements.clear()
+    response = await client.get(path, headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert response.json()
+    assert len(statements) <= budget, "\n\n".join(statements)
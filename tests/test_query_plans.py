@@ -0,0 +1,93 @@
+import re
+from datetime import datetime
+import pytest
+from sqlalchemy import func, select
+from api.feed import FEED_PAGE_KEY
+from api.loaders import ANNOUNCEMENT_PAGE_KEY, COMMUNITY_SORT_KEYS, EVENT_PAGE_KEY, POST_PAGE_KEY
+from api.models.user import Announcement, Comment, Community, CommunityMembership, Event, Like, Post, TimelineEntry
+from api.sync import announcement_sync, event_sync, post_sync
+from api.threads import thread_query
+from database.db import Base, async_engine
+from utils.pagination import keyset_paginate
+
+
+pytestmark = pytest.mark.anyio
+
+SINCE = datetime(2024, 1, 1)
+
+
+# The main query behind each list, thread, feed and sync route, and the
+# indexes (from migrations/versions/0003_index_pack.py) its plan must use.
+QUERIES = {
+    "posts": (lambda: keyset_paginate(select(Post), POST_PAGE_KEY), ["ix_posts_created_at_id"]),
+    "community posts": (
+        lambda: keyset_paginate(select(Post).where(Post.community_id == 1), POST_PAGE_KEY),
+        ["ix_posts_community_id_created_at_id"],
+    ),
+    "user posts": (
+        lambda: keyset_paginate(select(Post).where(Post.owner_id == 1), POST_PAGE_KEY),
+        ["ix_posts_owner_id_created_at_id"],
+    ),
+    "post comment thread": (
+        lambda: thread_query((Comment.post_id == 1, Comment.reply_to_comment_id.is_(None)), 10, None, 2, 3),
+        ["ix_comments_post_id_reply_to_comment_id_created_at_id", "ix_comments_reply_to_comment_id_created_at_id"],
+    ),
+    "event comment thread": (
+        lambda: thread_query((Comment.event_id == 1, Comment.reply_to_comment_id.is_(None)), 10, None, 2, 3),
+        ["ix_comments_event_id_reply_to_comment_id_created_at_id", "ix_comments_reply_to_comment_id_created_at_id"],
+    ),
+    "comment replies": (
+        lambda: thread_query((Comment.reply_to_comment_id == 1,), 10, None, 2, 3),
+        ["ix_comments_reply_to_comment_id_created_at_id"],
+    ),
+    "user comments": (lambda: select(Comment.id).where(Comment.user_id == 1), ["ix_comments_user_id"]),
+    "announcements": (lambda: keyset_paginate(select(Announcement), ANNOUNCEMENT_PAGE_KEY), ["ix_announcements_created_at_id"]),
+    "upcoming events": (
+        lambda: keyset_paginate(select(Event).where(Event.event_date >= SINCE), EVENT_PAGE_KEY, descending=False),
+        ["ix_events_event_date_id"],
+    ),
+    "feed": (
+        lambda: keyset_paginate(select(*FEED_PAGE_KEY).where(TimelineEntry.user_id == 1), FEED_PAGE_KEY),
+        ["ix_timeline_entries_user_id_created_at_post_id"],
+    ),
+    "largest communities": (
+        lambda: keyset_paginate(select(Community), COMMUNITY_SORT_KEYS["largest"]),
+        ["ix_communities_member_count_id"],
+    ),
+    "active communities": (
+        lambda: keyset_paginate(select(Community), COMMUNITY_SORT_KEYS["active"]),
+        ["ix_communities_last_activity_at_id"],
+    ),
+    "community members": (
+        lambda: select(CommunityMembership.user_id).where(CommunityMembership.community_id == 1),
+        ["ix_community_membership_community_id_user_id"],
+    ),
+    "post likes": (lambda: select(func.count()).select_from(Like).where(Like.post_id == 1), ["ix_likes_post_id"]),
+    "posts sync": (lambda: post_sync.changes_query(SINCE, 0, SINCE, 100), ["ix_posts_updated_at_id"]),
+    "events sync": (lambda: event_sync.changes_query(SINCE, 0, SINCE, 100), ["ix_events_updated_at_id"]),
+    "announcements sync": (lambda: announcement_sync.changes_query(SINCE, 0, SINCE, 100), ["ix_announcements_updated_at_id"]),
+    "tombstones": (
+        lambda: post_sync.tombstones_query(SINCE, 0, SINCE, 100),
+        ["ix_tombstones_resource_deleted_at_resource_id"],
+    ),
+}
+
+
+def full_scans(plan):
+    for detail in plan:
+        match = re.match(r"SCAN (\w+)", detail)
+        # Aliased tables show up as comments_1 and the like.
+        if match and re.sub(r"_\d+$", "", match.group(1)) in Base.metadata.tables and "INDEX" not in detail:
+            yield detail
+
+
+@pytest.mark.parametrize("name", QUERIES)
+async def test_query_uses_index(name, seeded):
+    statement, indexes = QUERIES[name]
+    async with async_engine.connect() as connection:
+        sql = str(statement().compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+        plan = [row[-1] for row in (await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))]
+
+    assert not list(full_scans(plan)), "\n".join(plan)
+    for index in indexes:
+        assert any(f"INDEX {index} " in f"{detail} " for detail in plan), "\n".join(plan)
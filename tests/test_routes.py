@@ -0,0 +1,148 @@
+import os
+import time
+import pytest
+import utils.utils
+from config.config import settings
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_sign_up_and_log_in(client, sign_up):
+    headers = await sign_up("alice")
+
+    response = await client.get("/users/profile/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["username"] == "alice_tester"
+
+    response = await client.post("/login", data={"username": "alice@example.com", "password": "wrong password"})
+    assert response.status_code == 403
+
+
+async def test_duplicate_sign_up(client, sign_up):
+    await sign_up("alice")
+    user = {"name": "other", "email": "alice@example.com", "bio": "bio", "username": "someone_else", "password": "password"}
+
+    response = await client.post("/users/", json=user)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "user already exists"}
+
+
+async def test_duplicate_sign_up_skips_a_busy_password_pool(client, sign_up, monkeypatch):
+    await sign_up("alice")
+    monkeypatch.setattr(utils.utils, "password_jobs", settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_DEPTH)
+    user = {"name": "other", "email": "bob@example.com", "bio": "bio", "username": "alice_tester", "password": "password"}
+
+    response = await client.post("/users/", json=user)
+    assert response.status_code == 400
+
+    response = await client.post("/users/", json={**user, "username": "bob_tester"})
+    assert response.status_code == 503
+
+
+async def test_posts(client, sign_up):
+    headers = await sign_up()
+
+    response = await client.post("/posts/", data={"content": "hello"}, headers=headers)
+    assert response.status_code == 201
+    post = response.json()
+    assert post["owner"]["username"] == "alice_tester"
+
+    response = await client.post(f"/posts/{post['id']}/comments", json={"content": "first"}, headers=headers)
+    assert response.status_code == 201
+
+    response = await client.get(f"/posts/{post['id']}/")
+    assert response.status_code == 200
+    assert [comment["content"] for comment in response.json()["comments"]] == ["first"]
+
+    response = await client.get("/posts/")
+    assert [item["id"] for item in response.json()] == [post["id"]]
+
+    response = await client.get("/posts/0/")
+    assert response.status_code == 404
+
+
+async def test_communities(client, sign_up):
+    headers = await sign_up()
+
+    response = await client.post("/communities/", json={"name": "readers", "description": "books"}, headers=headers)
+    assert response.status_code == 200
+    community = response.json()
+    assert community["member_count"] == 0
+
+    response = await client.post("/communities/", json={"name": "readers", "description": "again"}, headers=headers)
+    assert response.status_code == 400
+
+    response = await client.post(f"/communities/{community['id']}/posts", data={"content": "hi"}, headers=headers)
+    assert response.status_code == 403
+
+    response = await client.post(f"/communities/join/{community['id']}", headers=headers)
+    assert response.status_code == 202
+
+    response = await client.post(f"/communities/{community['id']}/posts", data={"content": "hi"}, headers=headers)
+    assert response.status_code == 201
+
+    response = await client.get(f"/communities/{community['id']}")
+    assert response.status_code == 200
+    assert response.json()["member_count"] == 1
+    assert response.json()["post_count"] == 1
+
+
+async def test_events(client, sign_up):
+    headers = await sign_up()
+    event = {"title": "exam", "description": "finals", "event_date": "2030-05-03T10:00:00Z", "location": "hall"}
+
+    response = await client.post("/events/", data=event, headers=headers)
+    assert response.status_code == 201
+    created = response.json()
+
+    response = await client.get(f"/events/{created['id']}")
+    assert response.status_code == 200
+    assert response.json()["title"] == "exam"
+
+    response = await client.post(f"/events/{created['id']}/comments", json={"content": "see you"}, headers=headers)
+    assert response.status_code == 201
+
+    response = await client.get("/events/calendar", params={"year": 2030, "month": 5})
+    assert response.json()["days"] == {"3": 1}
+
+
+async def test_announcements(client, sign_up):
+    headers = await sign_up()
+
+    response = await client.post("/announcements/", json={"content": "exams moved"}, headers=headers)
+    assert response.status_code == 201
+    assert response.json()["created_at"] is not None
+
+    response = await client.get("/announcements/")
+    assert [item["content"] for item in response.json()] == ["exams moved"]
+
+
+@pytest.fixture
+def behind_utc(monkeypatch):
+    # Local time five hours behind UTC, where rows stamped with the
+    # database's UTC now() would sit in the sync feeds' future.
+    monkeypatch.setenv("TZ", "Etc/GMT+5")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize("path, create", [
+    ("/posts/", {"data": {"content": "hello"}}),
+    ("/events/", {"data": {"title": "exam", "description": "finals", "event_date": "2030-05-03T10:00:00Z", "location": "hall"}}),
+    ("/announcements/", {"json": {"content": "exams moved"}}),
+])
+async def test_sync_sees_new_rows_in_any_timezone(path, create, client, sign_up, behind_utc, monkeypatch):
+    monkeypatch.setattr(settings, "SYNC_SETTLE_SECONDS", 0)
+    headers = await sign_up()
+    created = (await client.post(path, headers=headers, **create)).json()
+
+    response = await client.get(f"{path}sync")
+    assert [item["id"] for item in response.json()["changes"]] == [created["id"]]
+
+
+async def test_routes_need_a_token(client):
+    response = await client.post("/posts/", data={"content": "hello"})
+    assert response.status_code == 401
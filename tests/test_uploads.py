@@ -0,0 +1,76 @@
+import io
+import os
+import pytest
+from fastapi import BackgroundTasks, UploadFile
+from PIL import Image
+from config.config import settings
+from utils.storage import UPLOAD_DONE, schedule_upload, upload_status
+
+
+pytestmark = pytest.mark.anyio
+
+
+def png_bytes(size=(400, 300)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def stored_path(url: str) -> str:
+    return os.path.join(settings.LOCAL_STORAGE_ROOT, *url.removeprefix(settings.LOCAL_STORAGE_URL + "/").split("/"))
+
+
+async def test_upload_outlives_the_form_file(database):
+    # Newer FastAPI versions close form files before background tasks run.
+    file = UploadFile(io.BytesIO(png_bytes()), filename="photo.png")
+    tasks = BackgroundTasks()
+    url = await schedule_upload(file, tasks)
+    await file.close()
+    await tasks()
+
+    key = url.removeprefix(settings.LOCAL_STORAGE_URL + "/")
+    assert upload_status.get(key) == UPLOAD_DONE
+    with open(stored_path(url), "rb") as stored:
+        assert stored.read() == png_bytes()
+
+
+async def test_extension_comes_from_the_content(client, sign_up):
+    headers = await sign_up()
+    files = {"file": ("notes.txt", png_bytes(), "text/plain")}
+
+    response = await client.post("/posts/", data={"content": "photo"}, files=files, headers=headers)
+    assert response.status_code == 201
+    url = response.json()["post_image"]
+    assert url.endswith(".png")
+    assert os.path.exists(stored_path(url))
+
+
+async def test_image_variants_are_stored(client, sign_up):
+    headers = await sign_up()
+    files = {"file": ("photo.png", png_bytes(), "image/png")}
+
+    response = await client.post("/posts/", data={"content": "photo"}, files=files, headers=headers)
+    variants = response.json()["post_image_variants"]
+    assert set(variants) == {"thumbnail", "feed"}
+    with Image.open(stored_path(variants["thumbnail"])) as thumbnail:
+        assert max(thumbnail.size) <= 160
+
+
+async def test_no_variants_for_other_files(client, sign_up):
+    headers = await sign_up()
+    files = {"file": ("photo.png", b"just some text", "image/png")}
+
+    response = await client.post("/posts/", data={"content": "notes"}, files=files, headers=headers)
+    assert response.status_code == 201
+    assert response.json()["post_image_variants"] is None
+    assert os.path.exists(stored_path(response.json()["post_image"]))
+
+
+async def test_variant_links_resolve_when_rendering_fails(client, sign_up):
+    # A PNG header that Pillow identifies but can't decode.
+    headers = await sign_up()
+    files = {"file": ("photo.png", png_bytes()[:120], "image/png")}
+
+    response = await client.post("/posts/", data={"content": "broken"}, files=files, headers=headers)
+    for url in response.json()["post_image_variants"].values():
+        assert os.path.exists(stored_path(url))
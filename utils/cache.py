@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+caches = {}
+
+
+class TTLCache:
+    def __init__(self, name: str, maxsize: int, ttl: float, on_evict=None):
+        # `on_evict(key, value)` is called, under the lock, for entries pushed
+        # out by maxsize; expired entries are dropped silently.
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        caches[name] = self
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted, (evicted_value, _) = self._data.popitem(last=False)
+                if self.on_evict is not None:
+                    self.on_evict(evicted, evicted_value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in caches.items()}
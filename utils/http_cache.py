@@ -0,0 +1,277 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import urlencode
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from config.config import settings
+from utils.cache import TTLCache
+from utils.metrics import CollectedCounter, Gauge, register
+from utils.oauth2 import verify_access_token
+
+
+# Serialized GET responses, keyed by URL and validated against version
+# counters of the resources they were built from. Writes invalidate by
+# bumping a resource's version, so every cached page embedding it goes stale
+# at once without enumerating keys.
+#
+# Routes opt in with @cache_response("post:{post_id}", ...), where each tag is
+# formatted with the request's path params, and writes call
+# invalidate_responses() with the same tags after committing. Routes whose
+# response depends on who is asking pass per_viewer=True: requests with a
+# bearer token are cached per user and also tagged "viewer:{user_id}".
+# Routes whose response goes stale with time rather than with a write call
+# expire_response() with the moment it does.
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.entries = TTLCache("http_responses", settings.HTTP_CACHE_MAX_ENTRIES, settings.HTTP_CACHE_TTL_SECONDS)
+        # Tag versions are kept as long as the entries: a bump outlives every
+        # entry filled before it, so a tag that expires can't bring a stale
+        # entry back. Tags pushed out by HTTP_CACHE_MAX_TAGS raise `floor`,
+        # the version unknown tags read as, past their own, which turns away
+        # every entry filled before the eviction.
+        self.versions = TTLCache("http_versions", settings.HTTP_CACHE_MAX_TAGS, settings.HTTP_CACHE_TTL_SECONDS, self.evicted)
+        self.floor = 0
+        self.flags = TTLCache("http_flags", settings.HTTP_CACHE_MAX_TAGS, settings.HTTP_CACHE_TTL_SECONDS)
+        self.lock = threading.Lock()
+
+    def evicted(self, tag, version):
+        self.floor = max(self.floor, version)
+
+    async def get(self, key):
+        return self.entries.get(key)
+
+    async def set(self, key, entry):
+        self.entries.set(key, entry)
+
+    async def get_versions(self, tags):
+        with self.lock:
+            return [self.versions.get(tag, self.floor) for tag in tags]
+
+    async def bump(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.versions.set(tag, self.versions.get(tag, self.floor) + 1)
+
+    async def set_flag(self, name, seconds):
+        self.flags.set(name, True, ttl=seconds)
+
+    async def get_flag(self, name) -> bool:
+        return self.flags.get(name, False)
+
+
+class RedisBackend:
+    # Shares cached responses and invalidations between workers. Needs the
+    # optional redis package, e.g. against a local `redis-server`.
+
+    def __init__(self, url: str):
+        from redis import asyncio as redis
+
+        self.client = redis.from_url(url)
+
+    async def get(self, key):
+        cached = await self.client.hgetall(f"http:response:{key}")
+        if not cached:
+            return None
+        entry = json.loads(cached[b"meta"])
+        entry["body"] = cached[b"body"]
+        return entry
+
+    async def set(self, key, entry):
+        meta = json.dumps({name: value for name, value in entry.items() if name != "body"})
+        async with self.client.pipeline() as pipe:
+            pipe.hset(f"http:response:{key}", mapping={"meta": meta, "body": entry["body"]})
+            pipe.expire(f"http:response:{key}", settings.HTTP_CACHE_TTL_SECONDS)
+            await pipe.execute()
+
+    async def get_versions(self, tags):
+        if not tags:
+            return []
+        return [int(version or 0) for version in await self.client.mget([f"http:version:{tag}" for tag in tags])]
+
+    async def bump(self, tags):
+        async with self.client.pipeline() as pipe:
+            for tag in tags:
+                pipe.incr(f"http:version:{tag}")
+            await pipe.execute()
+
+    async def set_flag(self, name, seconds):
+        await self.client.set(f"http:flag:{name}", 1, px=max(1, int(seconds * 1000)))
+
+    async def get_flag(self, name) -> bool:
+        return bool(await self.client.exists(f"http:flag:{name}"))
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+        # When this process first saw each tag's current version.
+        self.seen_versions = TTLCache("http_seen_versions", settings.HTTP_CACHE_MAX_ENTRIES, settings.HTTP_CACHE_TTL_SECONDS)
+
+    def settled(self, tags, versions) -> bool:
+        # A read replica may lag the invalidation that bumped a version by
+        # up to REPLICA_MAX_LAG_SECONDS, so a page is only filled from it
+        # once all its tags have kept their version that long. Tags not seen
+        # before count as just bumped.
+        now, settled = time.monotonic(), True
+        for tag, version in zip(tags, versions):
+            seen = self.seen_versions.get(tag)
+            if seen is None or seen[0] != version:
+                seen = (version, now)
+                self.seen_versions.set(tag, seen)
+            settled = settled and now - seen[1] >= settings.REPLICA_MAX_LAG_SECONDS
+        return settled
+
+    async def serve(self, request: Request, tags, handler, per_viewer: bool = False):
+        tags = [tag.format(**request.path_params) for tag in tags]
+        key = request.url.path + "?" + urlencode(sorted(request.query_params.multi_items()))
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if per_viewer and scheme.lower() == "bearer" and token:
+            try:
+                viewer = verify_access_token(token, HTTPException(status_code=401)).id
+            except HTTPException:
+                # Let the route reject the token itself.
+                return await handler(request)
+            key += f"#viewer={viewer}"
+            tags.append(f"viewer:{viewer}")
+        versions = await self.backend.get_versions(tags)
+
+        entry = await self.backend.get(key)
+        if entry is not None and entry["versions"] == versions and not (entry.get("expires") and entry["expires"] <= time.time()):
+            self.hits += 1
+        else:
+            self.misses += 1
+            request.state.replica_allowed = self.settled(tags, versions)
+            response = await handler(request)
+            if response.status_code != 200:
+                return response
+
+            # Versions are read before the handler runs, so a write landing
+            # meanwhile leaves this entry stale rather than wrongly fresh.
+            body = bytes(response.body)
+            headers = [(name.decode(), value.decode()) for name, value in response.raw_headers if name != b"content-length"]
+            expires = response.headers.get("expires")
+            entry = {
+                "body": body,
+                "headers": headers,
+                "etag": '"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+                "versions": versions,
+                "expires": parsedate_to_datetime(expires).timestamp() if expires else None,
+            }
+            await self.backend.set(key, entry)
+
+        headers = dict(entry["headers"])
+        headers["etag"] = entry["etag"]
+        headers["cache-control"] = "no-cache"
+        if entry["etag"] in [etag.strip() for etag in request.headers.get("if-none-match", "").split(",")]:
+            self.not_modified += 1
+            self.bytes_saved += len(entry["body"])
+            headers.pop("content-type", None)
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["body"], headers=headers)
+
+    async def invalidate(self, *tags):
+        await self.backend.bump(tags)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+if settings.HTTP_CACHE_BACKEND == "redis":
+    response_cache = ResponseCache(RedisBackend(settings.HTTP_CACHE_REDIS_URL))
+else:
+    response_cache = ResponseCache(MemoryBackend())
+
+
+register(CollectedCounter(
+    "http_cache_lookups_total", "Cached GET routes served from the response cache or not.", ("result",),
+    lambda: {("hit",): response_cache.hits, ("miss",): response_cache.misses},
+))
+register(CollectedCounter(
+    "http_cache_not_modified_total", "Cached responses answered with 304 Not Modified.",
+    collect=lambda: {(): response_cache.not_modified},
+))
+register(CollectedCounter(
+    "http_cache_bytes_saved_total", "Response bytes not sent thanks to 304 Not Modified.",
+    collect=lambda: {(): response_cache.bytes_saved},
+))
+register(Gauge(
+    "http_cache_size", "Responses and tag versions held by the in-process response cache.", ("kind",),
+    lambda: {("responses",): response_cache.backend.entries.stats()["size"], ("tags",): response_cache.backend.versions.stats()["size"]}
+    if isinstance(response_cache.backend, MemoryBackend) else {},
+))
+
+
+def cache_response(*tags, per_viewer: bool = False):
+    def decorator(endpoint):
+        endpoint.response_cache_tags = tags
+        endpoint.response_cache_per_viewer = per_viewer
+        return endpoint
+    return decorator
+
+
+async def invalidate_responses(*tags):
+    await response_cache.invalidate(*tags)
+
+
+def request_user_id(request: Request):
+    # The user a valid bearer token belongs to, otherwise None.
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return verify_access_token(token, HTTPException(status_code=401)).id
+    except HTTPException:
+        return None
+
+
+# Read-your-writes: a user who sent a write in the last
+# REPLICA_MAX_LAG_SECONDS reads from the primary, whichever token, device or
+# worker the next request comes from. The window lives in the response
+# cache's backend, so it is shared across workers when that is redis.
+
+async def remember_writer(request: Request):
+    user_id = request_user_id(request)
+    if user_id is not None:
+        await response_cache.backend.set_flag(f"writer:{user_id}", settings.REPLICA_MAX_LAG_SECONDS)
+
+
+async def is_recent_writer(request: Request) -> bool:
+    user_id = request_user_id(request)
+    return user_id is not None and await response_cache.backend.get_flag(f"writer:{user_id}")
+
+
+def expire_response(response: Response, moment: datetime):
+    # Cached copies are served until `moment` at the latest, whatever the
+    # tag versions say.
+    response.headers["expires"] = format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+
+class CachedRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        tags = getattr(self.endpoint, "response_cache_tags", None)
+        if tags is None or "GET" not in self.methods:
+            return handler
+        per_viewer = self.endpoint.response_cache_per_viewer
+
+        async def cached_handler(request: Request) -> Response:
+            return await response_cache.serve(request, tags, handler, per_viewer)
+
+        return cached_handler
@@ -0,0 +1,64 @@
+import io
+import os
+import re
+from typing import Dict, Optional
+from PIL import Image, ImageOps
+
+
+# Resized copies generated for every uploaded image, as bounding boxes.
+# They are always re-encoded as JPEG next to the original.
+IMAGE_VARIANTS = {
+    "thumbnail": (160, 160),
+    "feed": (720, 2160),
+}
+VARIANT_QUALITY = 80
+
+# Upload types are sniffed from the bytes with Pillow; the client's filename
+# and content type are never trusted for the stored key or Content-Type.
+IMAGE_FORMATS = {"JPEG": "image/jpeg", "MPO": "image/jpeg", "PNG": "image/png", "GIF": "image/gif", "WEBP": "image/webp"}
+EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+# Keys that get variants: only uploads sniffed as an image are stored with
+# an image extension, so other content-addressed files never match.
+CONTENT_KEY_PATTERN = re.compile(
+    r"images/[0-9a-f]{2}/[0-9a-f]{64}(%s)$" % "|".join(sorted(re.escape(extension) for extension in set(EXTENSIONS.values())))
+)
+
+
+def sniff_content_type(fileobj) -> str:
+    fileobj.seek(0)
+    try:
+        with Image.open(fileobj) as image:
+            image_format = image.format
+    except Exception:
+        image_format = None
+    fileobj.seek(0)
+    return IMAGE_FORMATS.get(image_format, DEFAULT_CONTENT_TYPE)
+
+
+def content_key(digest: str, content_type: str) -> str:
+    return f"images/{digest[:2]}/{digest}{EXTENSIONS.get(content_type, '')}"
+
+
+def variant_key(key: str, name: str) -> str:
+    return f"{os.path.splitext(key)[0]}_{name}.jpg"
+
+
+def image_variants(url: Optional[str]) -> Optional[Dict[str, str]]:
+    if not url or not CONTENT_KEY_PATTERN.search(url):
+        return None
+    return {name: variant_key(url, name) for name in IMAGE_VARIANTS}
+
+
+def render_variants(fileobj):
+    fileobj.seek(0)
+    with Image.open(fileobj) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for name, size in IMAGE_VARIANTS.items():
+            variant = image.copy()
+            variant.thumbnail(size)
+            buffer = io.BytesIO()
+            variant.save(buffer, "JPEG", quality=VARIANT_QUALITY, optimize=True, progressive=True)
+            buffer.seek(0)
+            yield name, buffer
@@ -0,0 +1,288 @@
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+from urllib.parse import parse_qs
+from sqlalchemy import event
+from config.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def format_labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in values.items():
+            yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        # Counts per bucket are kept non-cumulative so an observation is one
+        # bisect and two additions; they are summed up when scraped.
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = {labels: list(counts) for labels, counts in self.values.items()}
+        for labels, counts in values.items():
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                total += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{format_labels(self.labels, labels, le)} {total}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {counts[-1]}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {total}"
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels=(), collect=None):
+        # Read when scraped: `collect` returns {label values: value}.
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect().items():
+            yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+
+
+class CollectedCounter(Gauge):
+    # A running total kept by another object, read when scraped.
+    kind = "counter"
+
+
+registry = []
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+request_duration = register(Histogram("http_request_duration_seconds", "Time to handle a request, until its body is sent.", ("method", "route", "status")))
+request_queries = register(Histogram("http_request_db_queries", "SQL statements run per request.", ("route",), QUERY_COUNT_BUCKETS))
+request_db_time = register(Histogram("http_request_db_seconds", "Time per request spent waiting on SQL statements.", ("route",)))
+request_serialization_time = register(Histogram("http_request_serialization_seconds", "Time per request spent rendering response bodies.", ("route",)))
+slow_queries = register(Counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS.", ("route",)))
+pool_checkout_time = register(Histogram("db_pool_checkout_seconds", "Time to check a connection out of the pool, waiting included.", ("engine",)))
+storage_save_time = register(Histogram("storage_save_seconds", "Time to store one uploaded object or variant.", ("backend",)))
+
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_time", "serialization_time")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+
+    @property
+    def route(self) -> str:
+        # Set on the scope by FastAPI once the request is routed, so this
+        # is the path template, e.g. /posts/{post_id}.
+        route = self.scope.get("route")
+        return route.path if route is not None else UNMATCHED_ROUTE
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def current_route() -> str:
+    stats = current_request.get()
+    return stats.route if stats is not None else "-"
+
+
+def record_serialization(seconds: float):
+    stats = current_request.get()
+    if stats is not None:
+        stats.serialization_time += seconds
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        route = current_route()
+        slow_queries.inc(route)
+        logger.warning("slow query (%.0f ms) in %s: %s", elapsed * 1000, route, statement)
+
+
+def handle_error(context):
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+engines = {}
+
+
+def pool_stats():
+    stats = {}
+    for name, engine in engines.items():
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            stats.update({
+                (name, "size"): pool.size(),
+                (name, "checked_out"): pool.checkedout(),
+                (name, "checked_in"): pool.checkedin(),
+                (name, "overflow"): pool.overflow(),
+            })
+    return stats
+
+
+pool_connections = register(Gauge("db_pool_connections", "Connection pool state.", ("engine", "state"), pool_stats))
+
+
+def instrument_engine(engine, name: str):
+    engines[name] = engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+def timed_pool(pool_class, name: str):
+    class TimedPool(pool_class):
+        def connect(self):
+            started = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                pool_checkout_time.observe(time.perf_counter() - started, name)
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+
+def profile_requested(scope) -> bool:
+    return settings.PROFILING_ENABLED and "1" in parse_qs(scope["query_string"].decode()).get("profile", ())
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: it runs in the request's own task, so the stats
+    # object it sets is the one the SQL hooks and render() add to.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            if profile_requested(scope):
+                await profile(self.app, scope, receive, send_wrapper)
+            else:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            route = stats.route
+            request_duration.observe(elapsed, scope["method"], route, status)
+            request_queries.observe(stats.queries, route)
+            request_db_time.observe(stats.db_time, route)
+            request_serialization_time.observe(stats.serialization_time, route)
+
+
+async def profile(app, scope, receive, send):
+    # Samples one request with the optional pyinstrument package and writes
+    # a speedscope flame graph (https://www.speedscope.app) to PROFILE_DIR;
+    # its path is returned in the X-Profile-Path header.
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    name = re.sub(r"[^\w]+", "_", scope["path"]).strip("_") or "root"
+    path = os.path.join(settings.PROFILE_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{scope['method']}-{name}-{time.perf_counter_ns()}.speedscope.json")
+
+    async def send_with_path(message):
+        if message["type"] == "http.response.start":
+            message.setdefault("headers", [])
+            message["headers"] = list(message["headers"]) + [(b"x-profile-path", path.encode())]
+        await send(message)
+
+    profiler = Profiler(interval=settings.PROFILE_INTERVAL_SECONDS, async_mode="enabled")
+    profiler.start()
+    try:
+        await app(scope, receive, send_with_path)
+    finally:
+        profiler.stop()
+        with open(path, "w") as output:
+            output.write(profiler.output(SpeedscopeRenderer()))
+        logger.info("profile of %s %s written to %s", scope["method"], scope["path"], path)
@@ -1,21 +1,30 @@
+import time
+from typing import Optional
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import status, HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached, object_session
 from config.config import settings
-from api.schemas.user import TokenData
-from database.db import get_db
+from api.schemas.user import TokenData, Profile
+from database.db import get_async_db
 from api.models.user import User
+from utils.cache import TTLCache
 
 
 outh2_schema = OAuth2PasswordBearer(tokenUrl="login")
+optional_outh2_schema = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
+verified_tokens = TTLCache("verified_tokens", settings.AUTH_CACHE_MAX_SIZE, settings.AUTH_CACHE_TTL_SECONDS)
+authenticated_users = TTLCache("authenticated_users", settings.AUTH_CACHE_MAX_SIZE, settings.AUTH_CACHE_TTL_SECONDS)
+
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -27,6 +36,10 @@ def create_access_token(data: dict):
 
 
 def verify_access_token(token: str, credentials_exception):
+    token_data = verified_tokens.get(token)
+    if token_data is not None:
+        return token_data
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         id: str = payload.get("user_id")
@@ -38,10 +51,32 @@ def verify_access_token(token: str, credentials_exception):
     except JWTError:
         raise credentials_exception
 
+    ttl = settings.AUTH_CACHE_TTL_SECONDS
+    if payload.get("exp"):
+        ttl = min(ttl, payload["exp"] - time.time())
+    verified_tokens.set(token, token_data, ttl=ttl)
+
     return token_data
 
 
-def get_current_user(token: str = Depends(outh2_schema), db: Session = Depends(get_db)):
+def invalidate_user(user_id: int):
+    authenticated_users.delete(user_id)
+
+
+@event.listens_for(User, "after_update")
+def invalidate_user_on_update(mapper, connection, target):
+    # Relating a new post or comment to a user also marks it dirty, only
+    # column changes should evict it.
+    if object_session(target).is_modified(target, include_collections=False):
+        invalidate_user(target.id)
+
+
+@event.listens_for(User, "after_delete")
+def invalidate_user_on_delete(mapper, connection, target):
+    invalidate_user(target.id)
+
+
+async def get_current_user(token: str = Depends(outh2_schema), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -49,6 +84,24 @@ def get_current_user(token: str = Depends(outh2_schema), db: Session = Depends(g
     )
 
     token = verify_access_token(token, credentials_exception)
-    user = db.query(User).filter(User.id == token.id).first()
 
-    return user
\ No newline at end of file
+    principal = authenticated_users.get(token.id)
+    if principal is None:
+        user = await db.scalar(select(User).where(User.id == token.id))
+        if user is None:
+            raise credentials_exception
+        authenticated_users.set(user.id, {field: getattr(user, field) for field in Profile.model_fields})
+        return user
+
+    # Attach the cached principal to this request's session without a
+    # SELECT, so routes can still relate new rows to it.
+    user = User(**principal)
+    make_transient_to_detached(user)
+    return await db.merge(user, load=False)
+
+
+async def get_optional_user(token: Optional[str] = Depends(optional_outh2_schema), db: AsyncSession = Depends(get_async_db)):
+    # For public routes that personalize their response when a token is sent.
+    if token is None:
+        return None
+    return await get_current_user(token, db)
@@ -0,0 +1,59 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values) -> str:
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns):
+    invalid_cursor = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise invalid_cursor
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise invalid_cursor
+
+    decoded = []
+    for column, value in zip(columns, values):
+        try:
+            if column.type.python_type is datetime:
+                value = datetime.fromisoformat(value)
+            else:
+                value = column.type.python_type(value)
+        except (TypeError, ValueError):
+            raise invalid_cursor
+        decoded.append(value)
+    return decoded
+
+
+def keyset_paginate(query, columns, cursor=None, skip=0, limit=10, descending=True):
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+
+    if cursor:
+        key = tuple_(*columns)
+        after = tuple_(*decode_cursor(cursor, columns))
+        query = query.filter(key < after if descending else key > after)
+    else:
+        query = query.offset(skip)
+
+    return query.limit(limit)
+
+
+def set_next_cursor(response: Response, items, columns, limit: int):
+    if not items or len(items) < limit:
+        return
+
+    last = items[-1]
+    values = [last[column.key] if isinstance(last, dict) else getattr(last, column.key) for column in columns]
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(values)
@@ -8,7 +8,7 @@ def is_authenticated(user: Profile = Depends(get_current_user)):
 	return user
 
 def is_admin(user: Profile = Depends(is_authenticated)):
-	if user.role.name != UserRole.ADMIN.value:
+	if user.role != UserRole.ADMIN.value:
 		raise HTTPException(status.HTTP_401_UNAUTHORIZED)
 
 	return user
\ No newline at end of file
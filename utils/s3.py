@@ -1,21 +1,35 @@
 import boto3
-from botocore.exceptions import NoCredentialsError
-from fastapi import UploadFile
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from config.config import settings
 
-def upload_file_to_s3(file: UploadFile) -> str:
-    bucket_name = settings.BUCKET_NAME
-    region = settings.REGION
-    access_key = settings.ACCESS_KEY
-    secret_key = settings.SECRET_ACCESS
 
-    s3 = boto3.client('s3', region_name=region,
-                      aws_access_key_id=access_key,
-                      aws_secret_access_key=secret_key)
+class S3Storage:
+    def __init__(self):
+        self.bucket_name = settings.BUCKET_NAME
+        # boto3 clients are thread safe, so one client and its connection
+        # pool is shared by every upload in the process.
+        self.client = boto3.client('s3', region_name=settings.REGION,
+                                   aws_access_key_id=settings.ACCESS_KEY,
+                                   aws_secret_access_key=settings.SECRET_ACCESS,
+                                   config=Config(max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS))
+        self.transfer_config = TransferConfig(multipart_threshold=settings.UPLOAD_CHUNK_SIZE,
+                                              multipart_chunksize=settings.UPLOAD_CHUNK_SIZE)
 
-    try:
-        s3.upload_fileobj(file.file, bucket_name, file.filename)
-        return f"https://{bucket_name}.s3.amazonaws.com/{file.filename}"
-    except NoCredentialsError:
-        print('Credentials not available')
-        return None
+    def url(self, key: str) -> str:
+        return f"https://{self.bucket_name}.s3.amazonaws.com/{key}"
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def save(self, key: str, fileobj, content_type=None):
+        extra_args = {"ContentType": content_type} if content_type else None
+        self.client.upload_fileobj(fileobj, self.bucket_name, key,
+                                   ExtraArgs=extra_args, Config=self.transfer_config)
@@ -0,0 +1,111 @@
+import time
+from inspect import isclass
+from typing import Literal, Union, get_args, get_origin
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from api.schemas.user import NORMALIZED_SCHEMAS, NormalizedPage, Profile
+from utils.metrics import record_serialization
+
+
+# Routes return render(Schema, rows) instead of the rows themselves. Rows come
+# from our own database, so instead of validating them (twice, with FastAPI's
+# response_model pass on top) the schema instances are constructed directly
+# from their attributes, once per row even where a row is embedded many times,
+# e.g. a post owner who also wrote the comments. pydantic-core then dumps them
+# straight to JSON bytes, skipping jsonable_encoder and stdlib json.dumps.
+# response_model stays on the route for the OpenAPI schema.
+#
+# Fields that depend on who is asking rather than on the row (liked_by_me)
+# are passed as `computed`, field name -> function of the row, so nothing
+# per viewer is ever stored on the shared ORM instances.
+
+SHAPE_NESTED = "nested"
+SHAPE_NORMALIZED = "normalized"
+Shape = Literal["nested", "normalized"]
+
+adapters = {}
+plans = {}
+
+
+def get_adapter(schema) -> TypeAdapter:
+    adapter = adapters.get(schema)
+    if adapter is None:
+        adapter = adapters[schema] = TypeAdapter(schema)
+    return adapter
+
+
+def is_model(annotation) -> bool:
+    return isclass(annotation) and issubclass(annotation, BaseModel)
+
+
+def field_plan(schema):
+    plan = plans.get(schema)
+    if plan is None:
+        plan = []
+        for name, field in schema.model_fields.items():
+            annotation = field.annotation
+            if get_origin(annotation) is Union:
+                annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+            if get_origin(annotation) is list and is_model(get_args(annotation)[0]):
+                plan.append((name, "list", get_args(annotation)[0]))
+            elif is_model(annotation):
+                plan.append((name, "model", annotation))
+            else:
+                plan.append((name, "value", None))
+        plans[schema] = plan
+    return plan
+
+
+def construct(schema, row, built: dict, users: dict = None, computed: dict = None):
+    key = (schema, id(row))
+    model = built.get(key)
+    if model is not None:
+        return model
+
+    # Normalized schemas name the relationships their *_id fields point at;
+    # the related users are collected for the page's `users` map.
+    for relation in getattr(schema, "references", {}).values():
+        user = row[relation] if isinstance(row, dict) else getattr(row, relation)
+        if user is not None and user.id not in users:
+            users[user.id] = construct(Profile, user, built, computed=computed)
+
+    values = {}
+    for name, kind, nested in field_plan(schema):
+        if computed and name in computed:
+            value = computed[name](row)
+        else:
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+        if value is not None and kind == "model":
+            value = construct(nested, value, built, users, computed)
+        elif value is not None and kind == "list":
+            value = [construct(nested, item, built, users, computed) for item in value]
+        values[name] = value
+
+    model = built[key] = schema.model_construct(**values)
+    return model
+
+
+def serialize(schema, content, shape: str = SHAPE_NESTED, computed: dict = None) -> bytes:
+    built = {}
+    if get_origin(schema) is not list:
+        return get_adapter(schema).dump_json(construct(schema, content, built, computed=computed))
+
+    item = get_args(schema)[0]
+    if shape == SHAPE_NORMALIZED:
+        item, users = NORMALIZED_SCHEMAS[item], {}
+        page = NormalizedPage[item].model_construct(data=[construct(item, row, built, users, computed) for row in content], users=users)
+        return get_adapter(NormalizedPage[item]).dump_json(page)
+
+    return get_adapter(schema).dump_json([construct(item, row, built, computed=computed) for row in content])
+
+
+def render(schema, content, status_code: int = 200, response: Response = None, shape: str = SHAPE_NESTED, computed: dict = None) -> Response:
+    # Headers set on the injected `response` parameter (e.g. the next page
+    # cursor) are only merged by FastAPI into responses it builds itself.
+    headers = dict(response.headers) if response is not None else None
+    if headers:
+        headers.pop("content-length", None)
+    started = time.perf_counter()
+    content = serialize(schema, content, shape, computed)
+    record_serialization(time.perf_counter() - started)
+    return Response(content=content, status_code=status_code, headers=headers, media_type="application/json")
@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from fastapi import BackgroundTasks, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from config.config import settings
+from utils.cache import TTLCache
+from utils.images import CONTENT_KEY_PATTERN, IMAGE_VARIANTS, content_key, render_variants, sniff_content_type, variant_key
+from utils.metrics import storage_save_time
+
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_PENDING = "pending"
+UPLOAD_DONE = "done"
+UPLOAD_FAILED = "failed"
+
+upload_status = TTLCache("uploads", 10000, 24 * 60 * 60)
+
+storage = None
+
+
+class LocalStorage:
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def save(self, key: str, fileobj, content_type=None):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as tmp:
+            shutil.copyfileobj(fileobj, tmp, settings.UPLOAD_CHUNK_SIZE)
+        os.chmod(tmp.name, 0o644)
+        os.replace(tmp.name, path)
+
+
+def get_storage():
+    global storage
+
+    if storage is None:
+        if settings.STORAGE_BACKEND == "local":
+            storage = LocalStorage(settings.LOCAL_STORAGE_ROOT, settings.LOCAL_STORAGE_URL)
+        else:
+            from utils.s3 import S3Storage
+            storage = S3Storage()
+    return storage
+
+
+def timed_save(key: str, fileobj, content_type=None):
+    started = time.perf_counter()
+    get_storage().save(key, fileobj, content_type)
+    storage_save_time.observe(time.perf_counter() - started, settings.STORAGE_BACKEND)
+
+
+def save_variants(key: str, fileobj, content_type: str):
+    # Responses advertise variant URLs for every image key, so something is
+    # stored under each of them: the original when it sniffed as an image but
+    # can't be decoded.
+    try:
+        variants = [(name, variant, "image/jpeg") for name, variant in render_variants(fileobj)]
+    except Exception:
+        logger.exception("could not generate image variants for %s, storing the original under their keys", key)
+        variants = [(name, fileobj, content_type) for name in IMAGE_VARIANTS]
+    for name, variant, variant_type in variants:
+        variant.seek(0)
+        timed_save(variant_key(key, name), variant, variant_type)
+
+
+def spool_upload(fileobj):
+    # Copies an upload into a file the storage layer owns, hashing it on the
+    # way. Returns the copy, its content key and its sniffed content type.
+    spooled = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_CHUNK_SIZE)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(settings.UPLOAD_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        spooled.write(chunk)
+    content_type = sniff_content_type(spooled)
+    return spooled, content_key(digest.hexdigest(), content_type), content_type
+
+
+def upload_file(key: str, fileobj, content_type=None):
+    try:
+        # Keys are content hashes, so an object that already exists holds
+        # exactly these bytes and its variants were made when it was stored.
+        if not get_storage().exists(key):
+            timed_save(key, fileobj, content_type)
+            if CONTENT_KEY_PATTERN.search(key):
+                save_variants(key, fileobj, content_type)
+    except Exception:
+        logger.exception("upload of %s failed", key)
+        upload_status.set(key, UPLOAD_FAILED)
+    else:
+        upload_status.set(key, UPLOAD_DONE)
+    finally:
+        fileobj.close()
+
+
+async def schedule_upload(file: UploadFile, background_tasks: BackgroundTasks) -> str:
+    # The object URL is known before the bytes are stored, so the upload runs
+    # after the response is sent. It reads a copy: from FastAPI 0.106 on, form
+    # files are closed before background tasks run.
+    spooled, key, content_type = await run_in_threadpool(spool_upload, file.file)
+    if upload_status.get(key) in (UPLOAD_PENDING, UPLOAD_DONE):
+        spooled.close()
+    else:
+        upload_status.set(key, UPLOAD_PENDING)
+        background_tasks.add_task(upload_file, key, spooled, content_type)
+    return get_storage().url(key)
@@ -1,6 +1,19 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
+from config.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_desired_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_desired_rounds=settings.BCRYPT_ROUNDS,
+)
+
+password_pool = None
+password_jobs = 0
 
 def hash_password(password):
     return pwd_context.hash(password)
@@ -8,7 +21,45 @@ def hash_password(password):
 def verify_password(plain_password, password):
     return pwd_context.verify(plain_password, password)
 
+def verify_and_update_password(plain_password, password):
+    return pwd_context.verify_and_update(plain_password, password)
+
+
+# bcrypt is CPU bound, so it runs in a small process pool instead of the
+# event loop or the request threadpool. Requests beyond the pool size plus
+# the queue depth are rejected right away rather than piling up.
+
+async def run_password_job(func, *args):
+    global password_pool, password_jobs
+
+    if password_jobs >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_DEPTH:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Server is busy, try again shortly",
+                            headers={"Retry-After": "1"})
+
+    if password_pool is None:
+        password_pool = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+
+    password_jobs += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_pool, func, *args)
+    finally:
+        password_jobs -= 1
+
+async def hash_password_async(password):
+    return await run_password_job(hash_password, password)
+
+async def verify_and_update_password_async(plain_password, password):
+    return await run_password_job(verify_and_update_password, plain_password, password)
+
+def shutdown_password_pool():
+    global password_pool
+
+    if password_pool is not None:
+        password_pool.shutdown(cancel_futures=True)
+        password_pool = None
+
 
 class RoleChoices():
     ADMIN = 'admin'
-    USER = 'user'
\ No newline at end of file
+    USER = 'user'